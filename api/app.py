@@ -1,12 +1,20 @@
 from fastapi.exceptions import RequestValidationError
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fakeredis.aioredis import FakeRedis
+from aioredis.exceptions import RedisError
 from aiohttp import ClientSession
-from aioredis import Redis
 import logging
 
-from utils.response import JSONResponse
+from utils.response import JSONResponse, TrustedJSONResponse
+from api.middleware import (
+    MetricsMiddleware,
+    QueryMiddleware,
+    RateLimitMiddleware,
+    ReadYourWritesMiddleware,
+)
+from api.services import metrics, piston
+from api.services.redis import InstrumentedRedis
 from api import versions
 import config
 
@@ -25,6 +33,14 @@ app = FastAPI(
 app.router.prefix = "/api"
 app.router.default_response_class = JSONResponse
 
+if config.validate_responses():
+    TrustedJSONResponse.validate = True
+
+# Added before CORS so rate limited responses still get CORS headers.
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(QueryMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+
 origins = ["*"]  # TODO: change origins later
 app.add_middleware(
     CORSMiddleware,
@@ -33,21 +49,44 @@ app.add_middleware(
     allow_origins=origins,
     expose_headers=["Location"],
 )
+app.add_middleware(MetricsMiddleware)
 app.include_router(versions.v1.router)
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Metrics in the Prometheus text format, only for the addresses in `METRICS_ALLOW_IPS`."""
+    allowed = [ip.strip() for ip in config.metrics_allow_ips().split(",")]
+    if "*" not in allowed and (
+        request.client is None or request.client.host not in allowed
+    ):
+        raise HTTPException(403, "Forbidden")
+
+    try:
+        stats = await piston.result_cache_stats()
+    except (RedisError, OSError) as e:
+        log.warning("Failed to collect the Piston result cache stats: %s" % e)
+    else:
+        for stat, value in stats.items():
+            metrics.PISTON_RESULT_CACHE.set(value, stat)
+
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.on_event("startup")
 async def on_startup():
     """Creates a ClientSession to be used app-wide."""
-    from api.services import redis, http
+    from api.services import ratelimit, redis, http, submissions
+
+    ratelimit.enabled = config.rate_limits()
 
     if http.session is None or http.session.closed:
-        http.session = ClientSession()
+        http.session = ClientSession(trace_configs=[metrics.trace_config()])
         log.info("Created HTTP ClientSession.")
 
     if redis.pool is None or redis.pool.connection is None:
         if (redis_uri := config.redis_uri()) is not None:
-            redis.pool = Redis.from_url(redis_uri)
+            redis.pool = InstrumentedRedis.from_url(redis_uri)
             log.info("Connected to redis server: " + str(redis.pool))
         else:
             redis.pool = FakeRedis()
@@ -57,11 +96,16 @@ async def on_startup():
                 "  > You can launch a local one using `docker compose up redis` and providing the url in env."
             )
 
+    if (concurrency := config.grading_workers()) > 0:
+        submissions.start_worker(concurrency=concurrency)
+
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    """Closes the app-wide ClientSession"""
-    from api.services import redis, http
+    """Closes the app-wide ClientSession, the redis connection and the replica pool."""
+    from api.services import redis, http, replica, submissions
+
+    await submissions.stop_worker()
 
     if http.session is not None and not http.session.closed:
         await http.session.close()
@@ -69,6 +113,10 @@ async def on_shutdown():
     if redis.pool is not None:
         await redis.pool.close()
 
+    if replica.pool is not None:
+        await replica.pool.close()
+        replica.pool = None
+
 
 @app.exception_handler(RequestValidationError)
 async def validation_handler(_: Request, err: RequestValidationError):
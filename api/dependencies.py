@@ -1,38 +1,48 @@
-import jwt
 import utils
-import config
 
 from api.models import User
-from typing import List, Union
+from api.services import loaders, replica, users, permissions as permission_cache
+from api.services.loaders import Loaders
+from api.services.permissions import UserPermissions
+from typing import List, NamedTuple, Optional, Tuple, Union
 from fastapi import Depends, HTTPException, Request
 
 from api.models import Role
 from api.models.permissions import BasePermission
 
 
+def _read_token(request: Request, optional: bool = False) -> Optional[Tuple[str, dict]]:
+    """
+    Reads and decodes the JWT token of a request, returns it with its claims.
+    Raises a 401 when it's missing or invalid, unless `optional` which returns `None` instead.
+    """
+    token = request.headers.get("authorization")
+
+    if token is None:
+        if optional:
+            return None
+
+        raise HTTPException(status_code=401)
+
+    data = users.decode(token)
+    if data is None:
+        if optional:
+            return None
+
+        raise HTTPException(status_code=401, detail="Invalid token.")
+
+    return token, data
+
+
 def authorization(app_only: bool = False, user_only: bool = False):
     if app_only and user_only:
         raise ValueError("app_only and user_only are mutually exclusive")
 
     async def inner(request: Request):
         """Attempts to locate and decode JWT token."""
-        token = request.headers.get("authorization")
-
-        if token is None:
-            raise HTTPException(status_code=401)
-
-        try:
-            data = jwt.decode(
-                jwt=token,
-                algorithms=["HS256"],
-                key=config.secret_key(),
-            )
-        except jwt.PyJWTError:
-            raise HTTPException(status_code=401, detail="Invalid token.")
-
-        data["uid"] = int(data["uid"])
+        token, _ = _read_token(request)
 
-        user = await User.fetch(data["uid"])
+        user: User = await users.resolve(token, loaders.get(request).users)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid token.")
 
@@ -47,28 +57,130 @@ def authorization(app_only: bool = False, user_only: bool = False):
     return Depends(inner)
 
 
-def has_permissions(permissions: List[Union[int, BasePermission]]):
-    async def inner(user=authorization()):
-        query = """
-            SELECT *
-              FROM roles r
-             WHERE r.id IN (
-                SELECT ur.role_id
-                  FROM userroles ur
-                 WHERE ur.user_id = $1
-            )
-        """
-        records = await Role.pool.fetch(query, user.id)
-        if not records:
-            raise HTTPException(403, "Missing Permissions")
+def token_data():
+    """Decodes the JWT token without fetching the user, resolves to its claims."""
 
-        user_permissions = 0
-        for record in records:
-            user_permissions |= record["permissions"]
+    async def inner(request: Request) -> dict:
+        _, data = _read_token(request)
+        return data
 
-        if not utils.has_permissions(user_permissions, permissions):
-            raise HTTPException(403, "Missing Permissions")
+    return Depends(inner)
+
+
+def request_loaders():
+    """Resolves to the :class:`Loaders` of the current request."""
+
+    async def inner(request: Request) -> Loaders:
+        return loaders.get(request)
+
+    return Depends(inner)
+
+
+def read_pool():
+    """
+    Resolves to the pool read-only routes query, the read replica unless it lags
+    or the user recently changed something, see :func:`api.services.replica.choose`.
+    """
+
+    async def inner(request: Request):
+        if replica.pool is None:
+            return await replica.choose()
+
+        token = _read_token(request, optional=True)
 
-        return [Role(**record) for record in records]
+        return await replica.choose(token[1]["uid"] if token else None)
 
     return Depends(inner)
+
+
+class EffectivePermissions(NamedTuple):
+    """The combined permissions of all the roles of a user."""
+
+    user: User
+    permissions: int
+    top_position: int
+
+
+def _permissions_dependency(
+    permissions: List[Union[int, BasePermission]], with_roles: bool
+):
+    required = utils.compile_permissions(permissions)
+    query = """
+        SELECT COALESCE(BIT_OR(r.permissions), 0) AS effective_permissions,
+               MIN(r.position) AS top_position
+               %s
+          FROM users u
+          LEFT JOIN userroles ur ON ur.user_id = u.id
+          LEFT JOIN roles r ON r.id = ur.role_id
+         WHERE u.id = $1
+         GROUP BY u.id
+    """ % (
+        ", COALESCE(JSON_AGG(r.*) FILTER (WHERE r.id IS NOT NULL), '[]') AS roles"
+        if with_roles
+        else ""
+    )
+
+    async def inner(request: Request):
+        token, _ = _read_token(request)
+
+        user = await users.resolve(token, loaders.get(request).users)
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid token.")
+
+        # Taken before the query, permissions changed in between aren't cached.
+        snapshot = None if with_roles else await permission_cache.snapshot()
+        cached = None
+        if snapshot is not None:
+            cached = await permission_cache.get(user.id, snapshot)
+
+        if cached is not None:
+            user_permissions, top_position = cached
+        else:
+            record = await User.pool.fetchrow(query, user.id)
+            if not record:
+                raise HTTPException(status_code=401, detail="Invalid token.")
+
+            user_permissions = record["effective_permissions"]
+            top_position = record["top_position"]
+
+            if snapshot is not None:
+                await permission_cache.store(
+                    user.id, UserPermissions(user_permissions, top_position), snapshot
+                )
+
+        if top_position is None:
+            raise HTTPException(403, "Missing Permissions")
+
+        if not utils.has_permissions(user_permissions, required):
+            raise HTTPException(403, "Missing Permissions")
+
+        if with_roles:
+            roles = [Role(**role) for role in record["roles"]]
+            for role in roles:
+                loaders.get(request).roles.prime(role)
+
+            return roles
+
+        return EffectivePermissions(
+            user=user,
+            permissions=user_permissions,
+            top_position=top_position,
+        )
+
+    return inner
+
+
+def has_permissions(permissions: List[Union[int, BasePermission]]):
+    """
+    Requires the user to have all `permissions`,
+    resolves to a list of all the :class:`Role` objects the user has.
+    """
+    return Depends(_permissions_dependency(permissions, with_roles=True))
+
+
+def effective_permissions(permissions: List[Union[int, BasePermission]]):
+    """
+    Requires the user to have all `permissions`,
+    resolves to an :class:`EffectivePermissions` without building the roles.
+    """
+    return Depends(_permissions_dependency(permissions, with_roles=False))
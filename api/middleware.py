@@ -0,0 +1,233 @@
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+import logging
+import math
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import config
+from api.services import metrics, queries, ratelimit, replica, users
+from utils.response import JSONResponse
+
+
+__all__ = (
+    "MetricsMiddleware",
+    "QueryMiddleware",
+    "RateLimitMiddleware",
+    "ReadYourWritesMiddleware",
+)
+
+log = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """Records the latency and status of every request by route template."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: Optional[Dict[Callable, str]] = None
+
+    def _prepare(self, scope: Scope) -> Dict[Callable, str]:
+        routes = {}
+
+        for route in scope["app"].routes:
+            if (endpoint := getattr(route, "endpoint", None)) is None:
+                continue
+
+            routes[endpoint] = route.path
+            for method in getattr(route, "methods", None) or ():
+                metrics.HTTP_REQUEST_DURATION.labels(method, route.path)
+
+        return routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if self._routes is None:
+            self._routes = self._prepare(scope)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self._routes.get(scope.get("endpoint"), "unmatched")
+            metrics.HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started, scope["method"], route
+            )
+            metrics.HTTP_REQUESTS.inc(scope["method"], route, str(status))
+
+
+class RateLimitMiddleware:
+    """
+    Rate limits requests with a token bucket per user, or per IP address for
+    requests without a valid token. Apps and users get different tiers.
+
+    Routes cost one token unless decorated with :func:`api.services.ratelimit.cost`.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._costs: Optional[List[Tuple[Pattern, set, int]]] = None
+
+    def _cost(self, scope: Scope) -> int:
+        if self._costs is None:
+            self._costs = [
+                (route.path_regex, route.methods, route.endpoint.__rate_limit_cost__)
+                for route in scope["app"].routes
+                if hasattr(getattr(route, "endpoint", None), "__rate_limit_cost__")
+            ]
+
+        for pattern, methods, cost in self._costs:
+            if scope["method"] in methods and pattern.match(scope["path"]):
+                return cost
+
+        return 1
+
+    async def _identify(self, scope: Scope) -> Tuple[str, ratelimit.Tier]:
+        headers: Dict[bytes, bytes] = dict(scope["headers"])
+
+        if (token := headers.get(b"authorization")) is not None:
+            user = await users.resolve(token.decode("latin-1"))
+            if user is not None:
+                tier = ratelimit.TIERS["app" if user.app else "user"]
+                return str(user.id), tier
+
+        # Behind a proxy this is the forwarded address, see `FORWARDED_ALLOW_IPS`.
+        client = scope.get("client")
+        return client[0] if client else "unknown", ratelimit.TIERS["anonymous"]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not ratelimit.enabled:
+            return await self.app(scope, receive, send)
+
+        key, tier = await self._identify(scope)
+        result = await ratelimit.hit(key, tier, self._cost(scope))
+
+        headers = {
+            "X-RateLimit-Limit": str(tier.capacity),
+            "X-RateLimit-Remaining": str(result.remaining),
+        }
+
+        if not result.allowed:
+            headers["Retry-After"] = str(math.ceil(result.retry_after))
+            response = JSONResponse(
+                status_code=429,
+                content={
+                    "error": "Too Many Requests",
+                    "message": "You are being rate limited",
+                    "retry_after": result.retry_after,
+                },
+                headers=headers,
+            )
+            return await response(scope, receive, send)
+
+        raw_headers = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + raw_headers
+
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class QueryMiddleware:
+    """
+    Records the queries of every request. In debug mode their count and duration
+    are sent in the `Server-Timing` header, with query warnings enabled requests
+    exceeding the query budget or repeating the same statement are logged.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # Read on the first request, after the CLI set them.
+        self.debug: Optional[bool] = None
+        self.warnings = False
+        self.budget = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.debug is None:
+            self.debug = config.debug()
+            self.warnings = config.query_warnings()
+            self.budget = config.query_budget()
+
+        if scope["type"] != "http" or not (self.debug or self.warnings):
+            return await self.app(scope, receive, send)
+
+        stats = queries.start()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timing = 'db;desc="%s queries";dur=%.2f' % (
+                    stats.count,
+                    stats.duration * 1000,
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timing.encode())
+                ]
+
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing if self.debug else send)
+
+        if self.warnings:
+            self._warn(scope, stats)
+
+    def _warn(self, scope: Scope, stats: queries.QueryStats) -> None:
+        request = "%s %s" % (scope["method"], scope["path"])
+
+        if stats.count > self.budget:
+            log.warning(
+                "%s made %s queries (budget %s), taking %.2fms."
+                % (request, stats.count, self.budget, stats.duration * 1000)
+            )
+
+        for query, count in stats.repeated(queries.REPEAT_THRESHOLD).items():
+            log.warning("%s repeated a query %s times: %s" % (request, count, query))
+
+
+class ReadYourWritesMiddleware:
+    """
+    Sends the reads of a user to the primary for a while after they successfully
+    changed something, so they see their change even when the read replica lags.
+    """
+
+    SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] in self.SAFE_METHODS
+            or replica.pool is None
+        ):
+            return await self.app(scope, receive, send)
+
+        headers: Dict[bytes, bytes] = dict(scope["headers"])
+        token = headers.get(b"authorization")
+        data = users.decode(token.decode("latin-1")) if token else None
+
+        if data is None:
+            return await self.app(scope, receive, send)
+
+        async def send_after_stick(message: Message) -> None:
+            # Before the response is sent, so the next request of the user can't race it.
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await replica.stick(data["uid"])
+
+            await send(message)
+
+        await self.app(scope, receive, send_after_stick)
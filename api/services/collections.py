@@ -0,0 +1,120 @@
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import hashlib
+
+from fastapi import Request, Response
+from postDB import Model
+
+import config
+from api.services import redis
+from utils.cache import LRUCache
+from utils.response import RawJSONResponse, TrustedJSONResponse
+
+
+__all__ = ("respond", "render", "render_query", "bump")
+
+TTL = 3600
+
+# Rendered collections by (name, version), the version is bumped by every change.
+_local = LRUCache(maxsize=64, ttl=TTL)
+
+
+def _version_key(name: str) -> str:
+    return "collections:%s:version" % name
+
+
+def _body_key(name: str, version: int) -> str:
+    return "collections:%s:%s" % (name, version)
+
+
+def render(model: Any, data: Any) -> bytes:
+    """Render `data` already shaped like `model`, see :class:`utils.TrustedJSONResponse`."""
+    return TrustedJSONResponse(data, model).body
+
+
+async def render_query(
+    model: Any,
+    query: str,
+    *args: Any,
+    column: Optional[str] = None,
+    order_by: Optional[str] = None,
+    pool: Optional[Any] = None,
+) -> bytes:
+    """
+    Render the rows of `query` as a JSON array already shaped like `model`,
+    containing the rows as objects or only the values of `column`.
+    The array is ordered by `order_by`, an expression over the columns of `query` as `t`,
+    the order of `query` itself isn't kept once wrapped.
+    The query runs on `pool`, or on the primary when missing.
+
+    Unless disabled by `JSON_PASSTHROUGH`, the array is built by PostgreSQL
+    and sent as is, skipping record decoding and serialization in Python.
+    """
+    order = " ORDER BY %s" % order_by if order_by else ""
+
+    if config.json_passthrough():
+        query = "SELECT COALESCE(JSON_AGG(%s%s), '[]')::TEXT FROM (%s) t" % (
+            "t.%s" % column if column else "t",
+            order,
+            query,
+        )
+        body = await (pool or Model.pool).fetchval(query, *args)
+
+        return RawJSONResponse(body.encode(), model).body
+
+    if order:
+        query = "SELECT * FROM (%s) t%s" % (query, order)
+
+    records = await (pool or Model.pool).fetch(query, *args)
+    if column:
+        return render(model, [record[column] for record in records])
+
+    return render(model, [dict(record) for record in records])
+
+
+async def bump(name: str) -> None:
+    """Mark the cached response of a collection as outdated, call after changing it."""
+    await redis.pool.incr(_version_key(name))
+
+
+async def _get(
+    name: str, version: int, renderer: Callable[[], Awaitable[bytes]]
+) -> Tuple[str, bytes]:
+    cached = _local.get((name, version))
+    if cached is not None:
+        return cached
+
+    key = _body_key(name, version)
+    body = await redis.pool.get(key)
+
+    if body is None:
+        body = await renderer()
+
+        # The first process to render a version wins, so every process serves the same bytes.
+        if not await redis.pool.set(key, body, ex=TTL, nx=True):
+            body = await redis.pool.get(key) or body
+
+    cached = ('"%s"' % hashlib.sha256(body).hexdigest()[:32], body)
+    _local.set((name, version), cached)
+    return cached
+
+
+async def respond(
+    request: Request, name: str, renderer: Callable[[], Awaitable[bytes]]
+) -> Response:
+    """
+    Respond with the cached rendering of a collection, `renderer` is only awaited
+    when the collection changed since it was last rendered.
+
+    Responses carry an `ETag`, requests with a matching `If-None-Match` get a 304.
+    """
+    version = int(await redis.pool.get(_version_key(name)) or 0)
+    etag, body = await _get(name, version, renderer)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")]
+
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
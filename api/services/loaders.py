@@ -0,0 +1,102 @@
+from typing import Dict, Generic, Iterable, List, Optional, Type, TypeVar
+import asyncio
+
+from fastapi import Request
+from postDB import Model
+
+from api.models import Role, User
+
+
+__all__ = ("Loader", "Loaders", "get")
+
+T = TypeVar("T", bound=Model)
+
+
+class Loader(Generic[T]):
+    """
+    Loads rows of a model by id, batching the loads issued in the same event loop
+    tick into a single `WHERE id = ANY($1)` query and memoizing the results.
+
+    :param model:   The :class:`postDB.Model` to load, its table needs an `id` column.
+    """
+
+    def __init__(self, model: Type[T]):
+        self.model = model
+        self.queries = 0
+        self._results: Dict[int, "asyncio.Future[Optional[T]]"] = {}
+        self._pending: Dict[int, "asyncio.Future[Optional[T]]"] = {}
+
+    def load(self, id: int) -> "asyncio.Future[Optional[T]]":
+        """Load the row with the provided id, resolves to `None` if it doesn't exist."""
+        if id in self._results:
+            return self._results[id]
+
+        loop = asyncio.get_event_loop()
+        future = self._results[id] = loop.create_future()
+
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+        self._pending[id] = future
+
+        return future
+
+    async def load_many(self, ids: Iterable[int]) -> List[Optional[T]]:
+        """Load multiple rows with a single query, in the order of `ids`."""
+        return list(await asyncio.gather(*(self.load(id) for id in ids)))
+
+    def prime(self, obj: T) -> None:
+        """Memoize an already fetched row."""
+        future = asyncio.get_event_loop().create_future()
+        future.set_result(obj)
+        self._results[obj.id] = future
+
+    def clear(self, id: int) -> None:
+        """Forget a memoized row, call after changing it."""
+        if id not in self._pending:
+            self._results.pop(id, None)
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        asyncio.ensure_future(self._fetch(pending))
+
+    async def _fetch(self, pending: Dict[int, "asyncio.Future[Optional[T]]"]) -> None:
+        self.queries += 1
+        query = "SELECT * FROM %s WHERE id = ANY($1::BIGINT[])" % (
+            self.model.__tablename__
+        )
+
+        try:
+            records = await self.model.pool.fetch(query, list(pending))
+        except Exception as e:
+            for id, future in pending.items():
+                self._results.pop(id, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        found = {record["id"]: self.model(**record) for record in records}
+        for id, future in pending.items():
+            if not future.done():
+                future.set_result(found.get(id))
+
+
+class Loaders:
+    """The loaders of a single request, see :func:`get`."""
+
+    def __init__(self):
+        self.users: Loader[User] = Loader(User)
+        self.roles: Loader[Role] = Loader(Role)
+
+    @property
+    def queries(self) -> int:
+        """Amount of queries the loaders made during the request."""
+        return self.users.queries + self.roles.queries
+
+
+def get(request: Request) -> Loaders:
+    """Returns the loaders of a request, creating them on first use."""
+    loaders = getattr(request.state, "loaders", None)
+    if loaders is None:
+        loaders = request.state.loaders = Loaders()
+
+    return loaders
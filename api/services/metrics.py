@@ -0,0 +1,297 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+from types import SimpleNamespace
+import time
+
+from aiohttp import TraceConfig, TraceRequestEndParams, TraceRequestExceptionParams
+from postDB import Model
+
+
+__all__ = (
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "render",
+    "trace_config",
+    "HTTP_REQUESTS",
+    "HTTP_REQUEST_DURATION",
+    "DB_POOL",
+    "REDIS_COMMAND_DURATION",
+    "REDIS_PIPELINED_COMMANDS",
+    "OUTBOUND_REQUEST_DURATION",
+    "PISTON_RESULT_CACHE",
+)
+
+# Seconds, from 1ms up to the Piston execution timeout.
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    15,
+)
+
+_registry: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, _escape(str(value))) for name, value in zip(names, values)
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A metric with a child per label set, children are created on first use and
+    kept so recording a value never allocates a new one.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Returns the child recording values for the provided label values."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError("%s expects labels %s" % (self.name, self.label_names))
+
+            child = self._children[values] = self._child()
+
+        return child
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.type),
+        ]
+        lines.extend(
+            "%s%s %s" % (name, labels, _format_value(value))
+            for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _child(self):
+        return SimpleNamespace(value=0)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.labels(*labels).value += amount
+
+    def samples(self):
+        for values, child in self._children.items():
+            yield self.name, _format_labels(self.label_names, values), child.value
+
+
+class Gauge(Metric):
+    """
+    A gauge either set directly, or collected when rendered by `collect`,
+    which returns the value of every label set.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Iterable[Tuple[Sequence[str], float]]]] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def _child(self):
+        return SimpleNamespace(value=0)
+
+    def set(self, value: float, *labels: str) -> None:
+        self.labels(*labels).value = value
+
+    def samples(self):
+        if self.collect is not None:
+            for values, value in self.collect():
+                self.set(value, *values)
+
+        for values, child in self._children.items():
+            yield self.name, _format_labels(self.label_names, values), child.value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def samples(self):
+        bucket_names = self.label_names + ("le",)
+
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                labels = _format_labels(bucket_names, values + (_format_value(bound),))
+                yield self.name + "_bucket", labels, cumulative
+
+            labels = _format_labels(bucket_names, values + ("+Inf",))
+            yield self.name + "_bucket", labels, child.count
+
+            labels = _format_labels(self.label_names, values)
+            yield self.name + "_sum", labels, child.sum
+            yield self.name + "_count", labels, child.count
+
+
+def render() -> str:
+    """Renders every metric in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+def _collect_pool() -> Iterable[Tuple[Sequence[str], float]]:
+    pool = Model.pool
+    if pool is None:
+        return ()
+
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+
+    return (
+        (("min",), pool.get_min_size()),
+        (("max",), pool.get_max_size()),
+        (("size",), size),
+        (("idle",), idle),
+        (("in_use",), size - idle),
+    )
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "Amount of handled requests.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling requests.",
+    ["method", "route"],
+)
+DB_POOL = Gauge(
+    "db_pool_connections",
+    "Connections of the PostgreSQL pool by state.",
+    ["state"],
+    collect=_collect_pool,
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Time spent on redis commands.",
+    ["command"],
+)
+REDIS_PIPELINED_COMMANDS = Counter(
+    "redis_pipelined_commands_total",
+    "Amount of commands sent in redis pipelines, their latency is recorded as PIPELINE.",
+    ["command"],
+)
+OUTBOUND_REQUEST_DURATION = Histogram(
+    "outbound_request_duration_seconds",
+    "Time spent on requests to other services, like Piston and Discord.",
+    ["host", "status"],
+)
+PISTON_RESULT_CACHE = Gauge(
+    "piston_result_cache",
+    "Hits, misses, entries and bytes of the cache of Piston execution results, shared by all processes.",
+    ["stat"],
+)
+
+
+async def _on_request_start(session, context, params) -> None:
+    context.started = time.perf_counter()
+
+
+async def _on_request_end(session, context, params: TraceRequestEndParams) -> None:
+    OUTBOUND_REQUEST_DURATION.observe(
+        time.perf_counter() - context.started,
+        params.url.host,
+        str(params.response.status),
+    )
+
+
+async def _on_request_exception(
+    session, context, params: TraceRequestExceptionParams
+) -> None:
+    OUTBOUND_REQUEST_DURATION.observe(
+        time.perf_counter() - context.started, params.url.host, "error"
+    )
+
+
+def trace_config() -> TraceConfig:
+    """Returns a trace config recording the latency of the requests of a ClientSession."""
+    config = TraceConfig()
+    config.on_request_start.append(_on_request_start)
+    config.on_request_end.append(_on_request_end)
+    config.on_request_exception.append(_on_request_exception)
+    return config
@@ -0,0 +1,132 @@
+from typing import NamedTuple, Optional
+import json
+
+from aioredis.exceptions import WatchError
+
+from api.models import UserRole
+from api.services import redis
+from utils.cache import LRUCache
+
+
+__all__ = (
+    "UserPermissions",
+    "Snapshot",
+    "snapshot",
+    "get",
+    "store",
+    "invalidate",
+    "invalidate_role",
+    "invalidate_all",
+)
+
+TTL = 600
+
+# Bumped on every mutation, in-process copies made at an older version are stale.
+VERSION_KEY = "permissions:version"
+# Bumped when role positions are renumbered, orphaning every cached entry in redis.
+GENERATION_KEY = "permissions:generation"
+
+_local = LRUCache(maxsize=4096, ttl=TTL)
+
+
+class UserPermissions(NamedTuple):
+    """The combined permissions and the highest (lowest number) role position of a user."""
+
+    permissions: int
+    top_position: Optional[int]
+
+
+class Snapshot(NamedTuple):
+    """The cache version and generation, taken before computing permissions."""
+
+    version: Optional[bytes]
+    generation: Optional[bytes]
+
+
+def _key(generation: Optional[bytes], user_id: int) -> str:
+    return "permissions:%s:%s" % (int(generation or 0), user_id)
+
+
+async def snapshot() -> Optional[Snapshot]:
+    """
+    Returns the current cache version and generation, `None` without redis.
+    Take it before reading permissions from the database and pass it to :func:`store`.
+    """
+    if redis.pool is None:
+        return None
+
+    return Snapshot(*await redis.pool.mget(VERSION_KEY, GENERATION_KEY))
+
+
+async def get(user_id: int, snapshot: Snapshot) -> Optional[UserPermissions]:
+    """Returns the cached permissions of a user, or `None` on a cache miss."""
+    cached = _local.get(user_id)
+    if cached is not None and cached[0] == snapshot.version:
+        return cached[1]
+
+    data = await redis.pool.get(_key(snapshot.generation, user_id))
+    if data is None:
+        return None
+
+    permissions = UserPermissions(**json.loads(data))
+    _local.set(user_id, (snapshot.version, permissions))
+    return permissions
+
+
+async def store(user_id: int, permissions: UserPermissions, snapshot: Snapshot) -> None:
+    """
+    Caches permissions of a user computed after taking `snapshot`.
+
+    Nothing is stored when the permissions were invalidated since,
+    they might have been computed from the data before the change.
+    """
+    async with redis.pool.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(VERSION_KEY, GENERATION_KEY)
+            if Snapshot(*await pipe.mget(VERSION_KEY, GENERATION_KEY)) != snapshot:
+                return
+
+            pipe.multi()
+            pipe.set(
+                _key(snapshot.generation, user_id),
+                json.dumps(permissions._asdict()),
+                ex=TTL,
+            )
+            await pipe.execute()
+        except WatchError:
+            return
+
+    _local.set(user_id, (snapshot.version, permissions))
+
+
+async def invalidate(*user_ids: int) -> None:
+    """Drops the cached permissions of the provided users."""
+    if redis.pool is None:
+        return
+
+    generation = await redis.pool.get(GENERATION_KEY)
+
+    pipe = redis.pool.pipeline(transaction=True)
+    if user_ids:
+        pipe.delete(*(_key(generation, user_id) for user_id in user_ids))
+    pipe.incr(VERSION_KEY)
+    await pipe.execute()
+
+
+async def invalidate_role(role_id: int) -> None:
+    """Drops the cached permissions of every member of a role."""
+    query = "SELECT user_id FROM userroles WHERE role_id = $1"
+    records = await UserRole.pool.fetch(query, role_id)
+
+    await invalidate(*(record["user_id"] for record in records))
+
+
+async def invalidate_all() -> None:
+    """Drops the cached permissions of every user, used when positions are renumbered."""
+    if redis.pool is None:
+        return
+
+    pipe = redis.pool.pipeline(transaction=True)
+    pipe.incr(GENERATION_KEY)
+    pipe.incr(VERSION_KEY)
+    await pipe.execute()
@@ -1,11 +1,31 @@
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Any, Dict, List
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+from aioredis.exceptions import RedisError
 
 import config
-from api.services import http
+from api.services import http, redis
 
 
-__all__ = ("get_runtimes", "get_runtimes_dict", "get_runtime", "Runtime")
+__all__ = (
+    "get_runtimes",
+    "get_runtimes_dict",
+    "get_runtime",
+    "has_runtime",
+    "get_runtime_index",
+    "refresh_runtimes",
+    "execute",
+    "execute_batch",
+    "result_cache_stats",
+    "Runtime",
+    "RuntimeIndex",
+    "ExecutionResult",
+)
 
 log = logging.getLogger()
 
@@ -13,6 +33,32 @@ _base_url: str = (
     config.piston_url().rstrip("/") + "/"
 )  # make sure there's a / at the end
 
+# Older indexes are still served, but refreshed in the background.
+RUNTIMES_TTL: float = 300.0
+# Seconds between refreshes while Piston can't be reached, the stale index is served meanwhile.
+RUNTIMES_RETRY_INTERVAL: float = 30.0
+
+# Time limits of a single execution, in seconds.
+EXECUTE_TIMEOUT: float = 15.0
+RUN_TIMEOUT: float = 3.0
+# Maximum amount of executions a single batch runs at the same time.
+EXECUTE_CONCURRENCY: int = 10
+
+# Execution results are cached in redis, keyed by a hash of everything that affects them.
+RESULT_CACHE_TTL: int = 24 * 60 * 60
+RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+RESULT_CACHE_MAX_ENTRY_BYTES: int = 256 * 1024
+
+_RESULTS_INDEX_KEY = "piston:results"  # Sorted set of cached hashes by insertion time.
+_RESULTS_SIZES_KEY = "piston:results:sizes"  # Hash of cached hashes to their size.
+_RESULTS_BYTES_KEY = "piston:results:bytes"
+_RESULTS_LOOKUPS_KEY = "piston:results:lookups"
+_RESULTS_MISSES_KEY = "piston:results:misses"
+
+_runtime_index: Optional["RuntimeIndex"] = None
+_refresh_task: Optional["asyncio.Task[RuntimeIndex]"] = None
+_refresh_failed_at = float("-inf")
+
 
 async def _make_request(method: str, endpoint: str, data: Any = None) -> Any:
     async with http.session.request(
@@ -35,29 +81,255 @@ async def get_runtimes_dict() -> Dict[str, List["Runtime"]]:
     all the runtimes with that name or alias.
     """
 
-    runtimes = await get_runtimes()
-    runtimes_dict = {}
+    return (await get_runtime_index()).languages
 
-    for runtime in runtimes:
-        if runtime.language in runtimes_dict:
-            runtimes_dict[runtime.language].append(runtime)
-        else:
-            runtimes_dict[runtime.language] = [runtime]
 
-        for alias in runtime.aliases:
-            if alias in runtimes_dict:
-                runtimes_dict[alias].append(runtime)
-            else:
-                runtimes_dict[alias] = [runtime]
+async def get_runtime(language: str) -> List["Runtime"]:
+    """Get a runtime with a language or an alias."""
 
-    return runtimes_dict
+    return (await get_runtime_index()).get(language)
 
 
-async def get_runtime(language: str) -> List["Runtime"]:
-    """Get a runtime with a language or an alias."""
+async def has_runtime(language: str, version: str) -> bool:
+    """Check if a version of a language or an alias is installed."""
+
+    return (await get_runtime_index()).has_version(language, version)
+
+
+async def get_runtime_index() -> "RuntimeIndex":
+    """Get the cached index of runtimes.
+
+    The first call waits for the runtimes to be fetched, after that an index older
+    than :data:`RUNTIMES_TTL` is returned as is while a refresh runs in the background.
+    After a failed refresh the next one waits :data:`RUNTIMES_RETRY_INTERVAL` seconds.
+    """
+
+    if _runtime_index is None:
+        return await refresh_runtimes()
+
+    if (
+        _runtime_index.age > RUNTIMES_TTL
+        and time.monotonic() - _refresh_failed_at > RUNTIMES_RETRY_INTERVAL
+        and (_refresh_task is None or _refresh_task.done())
+    ):
+        refresh_runtimes()
+
+    return _runtime_index
+
+
+def refresh_runtimes() -> "asyncio.Future[RuntimeIndex]":
+    """Fetch the runtimes from Piston and replace the cached index.
+
+    Concurrent calls share a single request, await the result to get the new index.
+    """
+
+    global _refresh_task
+
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.ensure_future(_refresh())
+
+    return asyncio.shield(_refresh_task)
+
+
+async def _refresh() -> "RuntimeIndex":
+    global _runtime_index, _refresh_failed_at
+
+    try:
+        _runtime_index = RuntimeIndex(await get_runtimes())
+    except Exception:
+        _refresh_failed_at = time.monotonic()
+        if _runtime_index is None:
+            raise
+
+        log.warning(
+            "Failed to refresh Piston runtimes, serving stale ones.", exc_info=True
+        )
+
+    return _runtime_index
+
+
+async def execute(
+    language: str,
+    version: str,
+    source: str,
+    stdin: str = "",
+    args: Iterable[str] = (),
+    timeout: float = None,
+) -> "ExecutionResult":
+    """Execute source code on Piston.
+
+    Results of identical executions are served from the result cache.
+    Raises :class:`asyncio.TimeoutError` if Piston doesn't answer within `timeout` seconds.
+    """
+
+    payload = {
+        "language": language,
+        "version": version,
+        "files": [{"content": source}],
+        "stdin": stdin,
+        "args": list(args),
+        "run_timeout": int(RUN_TIMEOUT * 1000),
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    data = await _get_cached_result(digest)
+    if data is None:
+        data = await asyncio.wait_for(
+            _make_request("POST", "execute", payload),
+            timeout=timeout or EXECUTE_TIMEOUT,
+        )
+        # Runs killed by a signal likely hit a limit of a busy Piston, they can succeed when retried.
+        if _completed(data):
+            await _cache_result(digest, data)
+
+    return ExecutionResult(data)
+
+
+async def result_cache_stats() -> Dict[str, int]:
+    """Get the amount of hits, misses, entries and bytes of the result cache."""
+
+    if redis.pool is None:
+        return {"hits": 0, "misses": 0, "entries": 0, "bytes": 0}
+
+    pipe = redis.pool.pipeline(transaction=False)
+    pipe.mget(_RESULTS_LOOKUPS_KEY, _RESULTS_MISSES_KEY, _RESULTS_BYTES_KEY)
+    pipe.zcard(_RESULTS_INDEX_KEY)
+    (lookups, misses, size), entries = await pipe.execute()
+
+    return {
+        "hits": int(lookups or 0) - int(misses or 0),
+        "misses": int(misses or 0),
+        "entries": entries,
+        "bytes": int(size or 0),
+    }
+
+
+def _completed(data: dict) -> bool:
+    """Whether every stage of an execution ran to completion, instead of being killed."""
+    return all(
+        (data.get(stage) or {}).get("signal") is None for stage in ("compile", "run")
+    )
 
-    runtimes_dict = await get_runtimes_dict()
-    return runtimes_dict.get(language, [])
+
+def _result_key(digest: str) -> str:
+    return "piston:results:%s" % digest
+
+
+async def _get_cached_result(digest: str) -> Optional[dict]:
+    if redis.pool is None:
+        return None
+
+    try:
+        pipe = redis.pool.pipeline(transaction=False)
+        pipe.get(_result_key(digest))
+        pipe.incr(_RESULTS_LOOKUPS_KEY)
+        data, _ = await pipe.execute()
+
+        # Only misses take a second round trip, they wait on Piston anyway.
+        if data is None:
+            await redis.pool.incr(_RESULTS_MISSES_KEY)
+    except (RedisError, OSError) as e:
+        log.warning("Executing without the result cache, redis failed: %s" % e)
+        return None
+
+    return None if data is None else json.loads(data)
+
+
+async def _cache_result(digest: str, data: dict) -> None:
+    if redis.pool is None:
+        return
+
+    try:
+        await _store_result(digest, data)
+    except (RedisError, OSError) as e:
+        log.warning("Failed to cache an execution result: %s" % e)
+
+
+async def _store_result(digest: str, data: dict) -> None:
+    value = json.dumps(data)
+    if len(value) > RESULT_CACHE_MAX_ENTRY_BYTES:
+        return
+
+    # Only the first of concurrent identical executions accounts for the entry.
+    if not await redis.pool.set(
+        _result_key(digest), value, ex=RESULT_CACHE_TTL, nx=True
+    ):
+        return
+
+    pipe = redis.pool.pipeline(transaction=True)
+    pipe.zadd(_RESULTS_INDEX_KEY, {digest: time.time()})
+    pipe.hset(_RESULTS_SIZES_KEY, digest, len(value))
+    pipe.incrby(_RESULTS_BYTES_KEY, len(value))
+    *_, size = await pipe.execute()
+
+    # Entries whose key already expired still count towards the size until evicted.
+    expired = await redis.pool.zrangebyscore(
+        _RESULTS_INDEX_KEY, "-inf", time.time() - RESULT_CACHE_TTL
+    )
+    if expired:
+        await _evict(expired)
+
+    while size > RESULT_CACHE_MAX_BYTES:
+        oldest = await redis.pool.zrange(_RESULTS_INDEX_KEY, 0, 15)
+        if not oldest:
+            break
+
+        size = await _evict(oldest)
+
+
+async def _evict(digests: List[bytes]) -> int:
+    """Remove entries from the result cache, returns the new size in bytes."""
+
+    sizes = await redis.pool.hmget(_RESULTS_SIZES_KEY, *digests)
+    removed = sum(int(size or 0) for size in sizes)
+
+    pipe = redis.pool.pipeline(transaction=True)
+    pipe.delete(*(_result_key(digest.decode()) for digest in digests))
+    pipe.zrem(_RESULTS_INDEX_KEY, *digests)
+    pipe.hdel(_RESULTS_SIZES_KEY, *digests)
+    pipe.decrby(_RESULTS_BYTES_KEY, removed)
+    *_, size = await pipe.execute()
+
+    return size
+
+
+async def execute_batch(
+    language: str,
+    version: str,
+    source: str,
+    stdins: Iterable[str],
+    args: Iterable[str] = (),
+    concurrency: int = None,
+    timeout: float = None,
+) -> AsyncIterator[Tuple[int, "ExecutionResult"]]:
+    """Execute source code once per stdin, running the executions concurrently.
+
+    Yields tuples of the index of the stdin and its result, in order of completion.
+    Executions that time out or fail yield a result with :attr:`ExecutionResult.error` set.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency or EXECUTE_CONCURRENCY)
+    args = list(args)
+
+    async def run(index: int, stdin: str) -> Tuple[int, ExecutionResult]:
+        async with semaphore:
+            try:
+                result = await execute(language, version, source, stdin, args, timeout)
+            except asyncio.TimeoutError:
+                result = ExecutionResult.from_error("Execution timed out")
+            except aiohttp.ClientError as e:
+                result = ExecutionResult.from_error("Piston request failed: %s" % e)
+
+            return index, result
+
+    tasks = [asyncio.ensure_future(run(i, stdin)) for i, stdin in enumerate(stdins)]
+
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 class Runtime:
@@ -66,3 +338,56 @@ class Runtime:
         self.version = data["version"]
         self.aliases = data["aliases"]
         self.runtime = data.get("runtime")
+
+
+class RuntimeIndex:
+    """Runtimes indexed by language names and aliases, with their versions."""
+
+    def __init__(self, runtimes: List[Runtime]):
+        self.runtimes = runtimes
+        self.languages: Dict[str, List[Runtime]] = {}
+        self.versions: Dict[str, set] = {}
+        self.fetched_at = time.monotonic()
+
+        for runtime in runtimes:
+            for name in (runtime.language, *runtime.aliases):
+                self.languages.setdefault(name, []).append(runtime)
+                self.versions.setdefault(name, set()).add(runtime.version)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the runtimes were fetched."""
+        return time.monotonic() - self.fetched_at
+
+    def get(self, language: str) -> List[Runtime]:
+        return self.languages.get(language, [])
+
+    def has_version(self, language: str, version: str) -> bool:
+        return version in self.versions.get(language, ())
+
+
+class ExecutionResult:
+    def __init__(self, data: dict, error: Optional[str] = None):
+        run = data.get("run") or {}
+
+        self.language = data.get("language")
+        self.version = data.get("version")
+        self.stdout = run.get("stdout", "")
+        self.stderr = run.get("stderr", "")
+        self.output = run.get("output", "")
+        self.code = run.get("code")
+        self.signal = run.get("signal")
+        self.compile = data.get("compile")
+        self.error = error
+
+    @classmethod
+    def from_error(cls, error: str) -> "ExecutionResult":
+        return cls({}, error=error)
+
+    @property
+    def success(self) -> bool:
+        """Whether the code compiled and exited with a 0 status code."""
+        if self.error is not None or self.code != 0:
+            return False
+
+        return self.compile is None or self.compile.get("code") == 0
@@ -0,0 +1,148 @@
+from typing import Any, Dict, List, Optional
+from contextvars import ContextVar
+from functools import lru_cache
+import time
+import re
+
+from asyncpg import Connection
+
+
+__all__ = (
+    "REPEAT_THRESHOLD",
+    "QueryStats",
+    "InstrumentedPool",
+    "fingerprint",
+    "start",
+    "current",
+)
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![$\w])\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*(?:\?|\$\d+)(?:\s*,\s*(?:\?|\$\d+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Executing the same statement this often in a request is likely N+1.
+REPEAT_THRESHOLD = 5
+
+_stats: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query: str) -> str:
+    """Normalizes a statement so the same query with other literals or formatting matches."""
+    query = _STRINGS.sub("?", query)
+    query = _NUMBERS.sub("?", query)
+    query = _LISTS.sub("(...)", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class QueryStats:
+    """The queries made while handling a single request."""
+
+    __slots__ = ("count", "duration", "fingerprints")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints: Dict[str, List] = {}  # [count, duration] by fingerprint.
+
+    def record(self, query: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+
+        key = fingerprint(query)
+        entry = self.fingerprints.get(key)
+        if entry is None:
+            entry = self.fingerprints[key] = [0, 0.0]
+
+        entry[0] += 1
+        entry[1] += duration
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """The fingerprints executed at least `threshold` times, likely from a loop."""
+        return {
+            query: count
+            for query, (count, _) in self.fingerprints.items()
+            if count >= threshold
+        }
+
+
+def start() -> QueryStats:
+    """Start recording the queries of the current context, like a request."""
+    stats = QueryStats()
+    _stats.set(stats)
+    return stats
+
+
+def current() -> Optional[QueryStats]:
+    """The stats recorded for the current context, if any."""
+    return _stats.get()
+
+
+def _timed(name: str):
+    """A method calling `name` on the wrapped object, recording the query it ran."""
+
+    async def method(self, query: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await getattr(self._wrapped, name)(query, *args, **kwargs)
+        finally:
+            stats = _stats.get()
+            if stats is not None:
+                stats.record(query, time.perf_counter() - started)
+
+    method.__name__ = method.__qualname__ = name
+    return method
+
+
+class _Instrumented:
+    """Times the query methods of the wrapped pool or connection."""
+
+    def __init__(self, wrapped: Any):
+        self._wrapped = wrapped
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._wrapped, name)
+
+    execute = _timed("execute")
+    executemany = _timed("executemany")
+    fetch = _timed("fetch")
+    fetchrow = _timed("fetchrow")
+    fetchval = _timed("fetchval")
+
+
+class InstrumentedConnection(_Instrumented):
+    pass
+
+
+class _AcquireContext:
+    def __init__(self, context: Any):
+        self._context = context
+
+    async def __aenter__(self) -> InstrumentedConnection:
+        return InstrumentedConnection(await self._context.__aenter__())
+
+    async def __aexit__(self, *exc) -> None:
+        await self._context.__aexit__(*exc)
+
+    def __await__(self):
+        return self._acquire().__await__()
+
+    async def _acquire(self) -> InstrumentedConnection:
+        return InstrumentedConnection(await self._context)
+
+
+class InstrumentedPool(_Instrumented):
+    """
+    Wraps the asyncpg pool of :class:`postDB.Model`, recording every query in the
+    :class:`QueryStats` of the current request.
+    """
+
+    def acquire(self, *args, **kwargs) -> _AcquireContext:
+        return _AcquireContext(self._wrapped.acquire(*args, **kwargs))
+
+    async def release(self, connection: Connection, *args, **kwargs) -> None:
+        if isinstance(connection, InstrumentedConnection):
+            connection = connection._wrapped
+
+        await self._wrapped.release(connection, *args, **kwargs)
@@ -0,0 +1,132 @@
+from typing import Callable, NamedTuple
+import logging
+import math
+import time
+
+from aioredis.exceptions import RedisError
+from fakeredis.aioredis import FakeRedis
+
+from api.services import redis
+from utils.cache import LRUCache
+
+
+__all__ = ("Tier", "Result", "TIERS", "enabled", "cost", "hit", "reset")
+
+log = logging.getLogger(__name__)
+
+
+class Tier(NamedTuple):
+    """A token bucket holding up to `capacity` tokens, refilled by `rate` tokens a second."""
+
+    name: str
+    capacity: int
+    rate: float
+
+
+class Result(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float  # Seconds until the request would be allowed, 0 if it is.
+
+
+TIERS = {
+    "anonymous": Tier("anonymous", capacity=60, rate=1.0),
+    "user": Tier("user", capacity=120, rate=2.0),
+    "app": Tier("app", capacity=600, rate=10.0),
+}
+
+# Returns {allowed, remaining tokens, milliseconds until allowed}.
+# The clock of redis is used, the clocks of the API hosts can drift apart.
+# Writing after reading TIME needs redis 5, which replicates the effects of scripts.
+SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    allowed = 1
+    tokens = tokens - cost
+else
+    retry_after = math.ceil((cost - tokens) / rate * 1000)
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000))
+
+return {allowed, math.floor(tokens), retry_after}
+"""
+
+enabled = True  # Disabled by the RATE_LIMITS environment variable and in tests.
+
+_script = None
+_script_pool = None
+
+# Buckets used when there is no real redis server, (tokens, updated_at) by key.
+_local = LRUCache(maxsize=65536, ttl=3600)
+
+
+def cost(value: int) -> Callable:
+    """Decorator setting the amount of tokens a request to the decorated route takes."""
+
+    def decorator(func: Callable) -> Callable:
+        func.__rate_limit_cost__ = value
+        return func
+
+    return decorator
+
+
+def _hit_local(key: str, tier: Tier, amount: int, now: float) -> Result:
+    tokens, updated_at = _local.get(key) or (tier.capacity, now)
+    tokens = min(tier.capacity, tokens + max(0.0, now - updated_at) * tier.rate)
+
+    if tokens >= amount:
+        _local.set(key, (tokens - amount, now))
+        return Result(True, math.floor(tokens - amount), 0.0)
+
+    _local.set(key, (tokens, now))
+    return Result(False, math.floor(tokens), (amount - tokens) / tier.rate)
+
+
+async def hit(key: str, tier: Tier, amount: int = 1) -> Result:
+    """
+    Take `amount` tokens from the bucket of `key`.
+
+    Buckets live in redis so every process shares them, and in-process when
+    running on FakeRedis or when redis can't be reached.
+    """
+    global _script, _script_pool
+
+    now = time.time()
+    key = "ratelimit:%s:%s" % (tier.name, key)
+
+    if redis.pool is None or isinstance(redis.pool, FakeRedis):
+        return _hit_local(key, tier, amount, now)
+
+    if _script_pool is not redis.pool:
+        _script = redis.pool.register_script(SCRIPT)
+        _script_pool = redis.pool
+
+    try:
+        allowed, remaining, retry_after = await _script(
+            keys=[key], args=[tier.capacity, tier.rate, amount]
+        )
+    except (RedisError, OSError) as e:
+        log.warning("Rate limiting in-process, redis failed: %s" % e)
+        return _hit_local(key, tier, amount, now)
+
+    return Result(bool(allowed), int(remaining), int(retry_after) / 1000)
+
+
+def reset() -> None:
+    """Forget the in-process buckets."""
+    _local.clear()
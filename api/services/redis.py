@@ -1,12 +1,15 @@
-from aioredis.client import EncodableT, ChannelT
+from aioredis.client import EncodableT, ChannelT, Pipeline
 from fakeredis.aioredis import FakeRedis
 from typing import Optional, Union, Any
 from aioredis import Redis
 import logging
 import json
+import time
 
+from api.services import metrics
 
-__all__ = ("pool",)
+
+__all__ = ("pool", "InstrumentedRedis", "InstrumentedPipeline")
 
 log = logging.getLogger(__name__)
 
@@ -23,4 +26,54 @@ async def dispatch(channel: ChannelT, message: Union[EncodableT, list, dict]) ->
     return await pool.publish(channel=channel, message=message)
 
 
+def _observe(started: float, command: Any) -> None:
+    metrics.REDIS_COMMAND_DURATION.observe(
+        time.perf_counter() - started, str(command).upper()
+    )
+
+
+class InstrumentedPipeline(Pipeline):
+    """
+    Records the latency of a pipeline as a whole, as `PIPELINE`, and counts the commands it sent.
+    Commands executed right away, like a `WATCH`, are recorded as usual.
+    """
+
+    async def immediate_execute_command(self, *args, **options) -> Any:
+        started = time.perf_counter()
+        try:
+            return await super().immediate_execute_command(*args, **options)
+        finally:
+            _observe(started, args[0])
+
+    async def execute(self, raise_on_error: bool = True) -> Any:
+        commands = [args[0] for args, _ in self.command_stack]
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            if commands:
+                _observe(started, "PIPELINE")
+
+                for command in commands:
+                    metrics.REDIS_PIPELINED_COMMANDS.inc(str(command).upper())
+
+
+class InstrumentedRedis(Redis):
+    """Records the latency of every command in the metrics."""
+
+    async def execute_command(self, *args, **options) -> Any:
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _observe(started, args[0])
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Optional[str] = None
+    ) -> InstrumentedPipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
 pool: Optional[Union[FakeRedis, Redis]] = None
@@ -0,0 +1,106 @@
+from typing import Optional, Union
+import asyncio
+import logging
+import time
+
+from asyncpg import Pool
+from postDB import Model
+
+import config
+from api.services import redis
+from api.services.queries import InstrumentedPool
+
+
+__all__ = ("pool", "lag", "stick", "is_sticky", "choose")
+
+log = logging.getLogger(__name__)
+
+# Seconds a measured lag is reused, so requests don't each ask the replica for it.
+LAG_INTERVAL = 1.0
+LAG_TIMEOUT = 1.0
+
+# Without a difference between the received and replayed WAL a streaming replica is caught up,
+# the last replayed transaction only gets older while nothing is written. A replica which lost
+# its connection to the primary receives nothing, so its lag is measured by that transaction.
+# The status of the WAL receiver is only visible to roles with `pg_read_all_stats`.
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT PG_IS_IN_RECOVERY() THEN 0
+        WHEN PG_LAST_WAL_RECEIVE_LSN() = PG_LAST_WAL_REPLAY_LSN()
+         AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE EXTRACT(EPOCH FROM NOW() - PG_LAST_XACT_REPLAY_TIMESTAMP())
+    END::FLOAT
+"""
+
+
+# The pool of the read replica, `None` when reads go to the primary.
+pool: Optional[InstrumentedPool] = None
+
+_check: Optional["asyncio.Future[float]"] = None
+_checked_at = 0.0
+
+
+def _sticky_key(user_id: int) -> str:
+    return "replica:sticky:%s" % user_id
+
+
+async def _measure() -> float:
+    global _checked_at
+
+    try:
+        value = await asyncio.wait_for(pool.fetchval(LAG_QUERY), LAG_TIMEOUT)
+    except Exception as e:
+        log.warning("Failed to measure the lag of the read replica: %s" % e)
+        value = None
+
+    _checked_at = time.monotonic()
+    return float("inf") if value is None else value
+
+
+async def lag() -> float:
+    """
+    Seconds the replica lags behind the primary, measured at most every `LAG_INTERVAL` seconds.
+    Infinite when the replica can't be reached.
+    """
+    global _check
+
+    if _check is None or (
+        _check.done() and time.monotonic() - _checked_at >= LAG_INTERVAL
+    ):
+        _check = asyncio.ensure_future(_measure())
+
+    # Shielded, a cancelled request shouldn't cancel the measurement other requests wait for.
+    return await asyncio.shield(_check)
+
+
+async def stick(user_id: int) -> None:
+    """Send the reads of a user to the primary for a while, call after they changed something."""
+    seconds = config.replica_sticky_seconds()
+
+    if pool is not None and seconds > 0:
+        await redis.pool.set(_sticky_key(user_id), 1, ex=seconds)
+
+
+async def is_sticky(user_id: int) -> bool:
+    """Whether the reads of a user go to the primary, see :func:`stick`."""
+    return bool(await redis.pool.exists(_sticky_key(user_id)))
+
+
+async def choose(user_id: Optional[int] = None) -> Union[Pool, InstrumentedPool]:
+    """
+    Returns the pool to read from, the replica unless it lags more than `REPLICA_MAX_LAG`
+    seconds or the user changed something in the last `REPLICA_STICKY_SECONDS` seconds.
+
+    Reads which end up in a shared cache, like rendered collections and permissions,
+    shouldn't use this, a lagging replica would cache outdated data until the next change.
+    """
+    if pool is None:
+        return Model.pool
+
+    if user_id is not None and await is_sticky(user_id):
+        return Model.pool
+
+    if await lag() > config.replica_max_lag():
+        return Model.pool
+
+    return pool
@@ -0,0 +1,290 @@
+from typing import Optional, Set
+import asyncio
+import logging
+import socket
+import time
+import os
+
+from aioredis.exceptions import ResponseError
+from fakeredis.aioredis import FakeRedis
+from postDB import Model
+
+from api.services import piston, redis
+
+
+__all__ = ("enqueue", "start_worker", "stop_worker", "Worker")
+
+log = logging.getLogger(__name__)
+
+STREAM_KEY = "submissions"
+GROUP_NAME = "graders"
+STREAM_MAX_LENGTH = 100_000
+BLOCK_MS = 5000  # How long a worker waits for new submissions before checking again.
+CLAIM_IDLE_MS = 5 * 60 * 1000  # Submissions pending for longer belong to a dead worker.
+CLAIM_INTERVAL = 60  # Seconds between looking for submissions of dead workers.
+
+worker: Optional["Worker"] = None
+_worker_task: Optional[asyncio.Task] = None
+# Submissions graded in-process while there's no redis server to queue them in.
+_local_tasks: Set[asyncio.Task] = set()
+
+
+async def enqueue(submission_id: int) -> None:
+    """
+    Add a submission to the grading queue.
+    Without a redis server the submission is graded in the background of this process instead.
+    """
+    if isinstance(redis.pool, FakeRedis):
+        log.warning(
+            "Grading submission %s in-process, redis is missing." % submission_id
+        )
+        task = asyncio.ensure_future(_grade_safely(submission_id))
+        _local_tasks.add(task)
+        task.add_done_callback(_local_tasks.discard)
+        return
+
+    await redis.pool.xadd(
+        STREAM_KEY,
+        {"id": submission_id},
+        maxlen=STREAM_MAX_LENGTH,
+        approximate=True,
+    )
+
+
+class Worker:
+    """
+    Grades queued submissions as a member of the `graders` consumer group.
+
+    :param int concurrency:     Maximum amount of submissions graded at the same time,
+                                no new submissions are read while all slots are used.
+    :param str name:            Consumer name, submissions left pending by a consumer
+                                with the same name are picked up on start.
+
+    Submissions left pending by dead workers are claimed and graded every `CLAIM_INTERVAL` seconds.
+    """
+
+    def __init__(self, concurrency: int = 4, name: Optional[str] = None):
+        self.concurrency = concurrency
+        self.name = name or "%s-%s" % (socket.gethostname(), os.getpid())
+        self._tasks: Set[asyncio.Task] = set()
+        self._grading: Set[bytes] = set()
+        self._claim_cursor: Optional[bytes] = b"0-0"
+        self._reading: Optional[asyncio.Future] = None
+        self._stopping = False
+
+    async def run(self) -> None:
+        """Read and grade submissions until :meth:`stop` is called."""
+        try:
+            await redis.pool.xgroup_create(
+                STREAM_KEY, GROUP_NAME, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        log.info("Grading worker %s started." % self.name)
+
+        # Start with the submissions we read but didn't acknowledge before a restart.
+        pending_id = "0"
+        next_claim = 0.0
+
+        while not self._stopping:
+            if len(self._tasks) >= self.concurrency:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            if pending_id is not None:
+                entries = await self._read(pending_id, block=None)
+                if not entries:
+                    pending_id = None
+                    continue
+
+                pending_id = entries[-1][0]
+            elif self._claim_cursor is not None and time.monotonic() >= next_claim:
+                next_claim = time.monotonic() + CLAIM_INTERVAL
+                entries = await self._claim_stale()
+            else:
+                self._reading = asyncio.ensure_future(self._read(">", block=BLOCK_MS))
+                try:
+                    entries = await self._reading
+                except asyncio.CancelledError:
+                    if not self._stopping:
+                        raise
+                    break
+
+            for entry_id, fields in entries:
+                if not fields:  # Trimmed from the stream before we could grade it.
+                    await redis.pool.xack(STREAM_KEY, GROUP_NAME, entry_id)
+                    continue
+
+                # Claimed back from ourselves while we're slow to grade it.
+                if entry_id in self._grading:
+                    continue
+
+                task = asyncio.ensure_future(self._grade(entry_id, int(fields[b"id"])))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+
+    async def _read(self, last_id: str, block: Optional[int]) -> list:
+        response = await redis.pool.xreadgroup(
+            GROUP_NAME,
+            self.name,
+            {STREAM_KEY: last_id},
+            count=self.concurrency - len(self._tasks),
+            block=block,
+        )
+        return response[0][1] if response else []
+
+    async def _claim_stale(self) -> list:
+        """Claims submissions pending for longer than `CLAIM_IDLE_MS`, resolves to their entries."""
+        try:
+            response = await redis.pool.execute_command(
+                "XAUTOCLAIM",
+                STREAM_KEY,
+                GROUP_NAME,
+                self.name,
+                CLAIM_IDLE_MS,
+                self._claim_cursor,
+                "COUNT",
+                self.concurrency - len(self._tasks),
+            )
+        except ResponseError as e:
+            # XAUTOCLAIM needs redis 6.2, stale submissions are only graded by a restarted worker.
+            log.warning("Not claiming stale submissions: %s" % e)
+            self._claim_cursor = None
+            return []
+
+        # Continue after the claimed entries next time, back at the start once all were seen.
+        self._claim_cursor = response[0]
+        entries = []
+
+        for entry in response[1]:
+            if entry is None:
+                continue
+
+            entry_id, fields = entry
+            if isinstance(fields, list):
+                fields = dict(zip(fields[::2], fields[1::2]))
+
+            entries.append((entry_id, fields))
+
+        if entries:
+            log.info("Claimed %s stale submissions." % len(entries))
+
+        return entries
+
+    def stop(self) -> None:
+        """Stop reading new submissions, the ones being graded are finished first."""
+        self._stopping = True
+
+        if self._reading is not None:
+            self._reading.cancel()
+
+    async def _grade(self, entry_id: bytes, submission_id: int) -> None:
+        self._grading.add(entry_id)
+        await _grade_safely(submission_id)
+        await redis.pool.xack(STREAM_KEY, GROUP_NAME, entry_id)
+        self._grading.discard(entry_id)
+
+
+async def _grade_safely(submission_id: int) -> None:
+    try:
+        await grade(submission_id)
+    except Exception:
+        log.exception("Failed to grade submission %s." % submission_id)
+        await Model.pool.execute(
+            "UPDATE challengesubmissions SET status = 'errored' WHERE id = $1",
+            submission_id,
+        )
+
+
+def start_worker(concurrency: int) -> None:
+    """
+    Start grading submissions in the background of the current event loop.
+    Skipped without a redis server, submissions are then graded as they're enqueued.
+    """
+    global worker, _worker_task
+
+    if isinstance(redis.pool, FakeRedis):
+        log.warning("Not starting the grading worker, FakeRedis has no streams.")
+        return
+
+    if _worker_task is not None and not _worker_task.done():
+        return
+
+    worker = Worker(concurrency=concurrency)
+    _worker_task = asyncio.ensure_future(worker.run())
+
+
+async def stop_worker() -> None:
+    """Stop the background worker, waiting for the submissions it's grading."""
+    if _local_tasks:
+        await asyncio.wait(_local_tasks)
+
+    if _worker_task is None or _worker_task.done():
+        return
+
+    worker.stop()
+    await _worker_task
+
+
+async def grade(submission_id: int) -> None:
+    """Run a submission against the test cases of its challenge and store the results."""
+    query = """
+        UPDATE challengesubmissions s
+           SET status = 'running'
+          FROM challengelanguages l
+         WHERE s.id = $1
+           AND l.id = s.language_id
+     RETURNING s.challenge_id, s.code, l.piston_lang, l.piston_lang_ver
+    """
+    submission = await Model.pool.fetchrow(query, submission_id)
+    if submission is None:
+        return
+
+    query = """
+        SELECT id, stdin, expected_output
+          FROM challengetestcases
+         WHERE challenge_id = $1
+         ORDER BY id
+    """
+    test_cases = await Model.pool.fetch(query, submission["challenge_id"])
+
+    results = [None] * len(test_cases)
+    async for index, result in piston.execute_batch(
+        submission["piston_lang"],
+        submission["piston_lang_ver"],
+        submission["code"],
+        [test_case["stdin"] for test_case in test_cases],
+    ):
+        test_case = test_cases[index]
+        results[index] = {
+            "test_case_id": str(test_case["id"]),
+            "passed": result.success
+            and result.stdout.strip() == test_case["expected_output"].strip(),
+            "error": result.error,
+        }
+
+    passed = sum(result["passed"] for result in results)
+
+    query = """
+        UPDATE challengesubmissions
+           SET status = $2,
+               passed = $3,
+               total = $4,
+               results = $5,
+               graded_at = NOW() AT TIME ZONE 'utc'
+         WHERE id = $1
+    """
+    await Model.pool.execute(
+        query,
+        submission_id,
+        # A challenge without test cases can't be passed, it's misconfigured.
+        "passed" if results and passed == len(results) else "failed",
+        passed,
+        len(results),
+        results,
+    )
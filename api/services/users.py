@@ -0,0 +1,134 @@
+from typing import TYPE_CHECKING, Optional
+import hashlib
+import json
+import time
+
+import jwt
+
+import config
+from api.models import User
+from api.services import redis
+from utils.cache import LRUCache
+
+if TYPE_CHECKING:
+    from api.services.loaders import Loader
+
+
+__all__ = ("decode", "resolve", "invalidate")
+
+LOCAL_TTL = 30.0  # Short so other processes pick up invalidations quickly.
+REDIS_TTL = 300
+MAX_TTL = 3600  # Tokens without an `exp` claim are still only cached for an hour.
+
+# Bumped by every invalidation, processes drop their local cache when they see it change.
+# Checked at most every `VERSION_INTERVAL` seconds.
+VERSION_KEY = "auth:users:version"
+VERSION_INTERVAL = 1.0
+
+_local = LRUCache(maxsize=4096, ttl=LOCAL_TTL)
+_version: Optional[bytes] = None
+_version_checked_at = 0.0
+
+
+def _token_key(token: str) -> str:
+    return "auth:tokens:" + hashlib.sha256(token.encode()).hexdigest()
+
+
+def _user_key(user_id: int) -> str:
+    return "auth:users:%s" % user_id
+
+
+async def _check_version() -> None:
+    """Drops the local cache when another process invalidated a user since the last check."""
+    global _version, _version_checked_at
+
+    if redis.pool is None or time.monotonic() - _version_checked_at < VERSION_INTERVAL:
+        return
+
+    # Set before awaiting, so concurrent requests don't all check.
+    _version_checked_at = time.monotonic()
+    version = await redis.pool.get(VERSION_KEY)
+
+    if version != _version:
+        _local.clear()
+        _version = version
+
+
+def decode(token: str) -> Optional[dict]:
+    """Decodes a JWT token, returns `None` if it's invalid."""
+    try:
+        data = jwt.decode(
+            jwt=token,
+            algorithms=["HS256"],
+            key=config.secret_key(),
+        )
+    except jwt.PyJWTError:
+        return None
+
+    data["uid"] = int(data["uid"])
+    return data
+
+
+async def resolve(token: str, loader: "Loader[User]" = None) -> Optional[User]:
+    """
+    Returns the user a JWT token belongs to, or `None` if the token is invalid.
+
+    Resolved users are cached in-process first and in redis second,
+    neither of them outliving the expiry of the token.
+    Users missing from both are fetched through `loader` when provided.
+    """
+    await _check_version()
+
+    user = _local.get(token)
+    if user is not None:
+        return user
+
+    data = decode(token)
+    if data is None:
+        return None
+
+    ttl = MAX_TTL
+    if data.get("exp") is not None:
+        ttl = min(ttl, data["exp"] - time.time())
+
+    key = _token_key(token)
+    cached = await redis.pool.get(key) if redis.pool is not None else None
+
+    if cached is not None:
+        user = User(**json.loads(cached))
+    else:
+        if loader is not None:
+            user = await loader.load(data["uid"])
+        else:
+            user = await User.fetch(data["uid"])
+        if not user:
+            return None
+
+        if redis.pool is not None and ttl >= 1:
+            pipe = redis.pool.pipeline(transaction=True)
+            pipe.set(key, json.dumps(user.as_dict()), ex=int(min(ttl, REDIS_TTL)))
+            pipe.sadd(_user_key(user.id), key)
+            pipe.expire(_user_key(user.id), MAX_TTL)
+            await pipe.execute()
+
+    _local.set(token, user, ttl=min(ttl, LOCAL_TTL))
+    return user
+
+
+async def invalidate(user_id: int) -> None:
+    """
+    Drops every cached token resolving to the user with the provided id.
+    Other processes drop theirs within `VERSION_INTERVAL` seconds.
+    """
+    for token, user in _local.items():
+        if user.id == user_id:
+            _local.pop(token)
+
+    if redis.pool is None:
+        return
+
+    keys = await redis.pool.smembers(_user_key(user_id))
+    pipe = redis.pool.pipeline(transaction=True)
+    pipe.delete(_user_key(user_id), *keys)
+    pipe.incr(VERSION_KEY)
+    await pipe.execute()
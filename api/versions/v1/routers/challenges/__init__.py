@@ -1,6 +1,7 @@
-from . import languages
+from . import languages, submissions
 from .routes import router
 
 router.include_router(languages.router)
+router.include_router(submissions.router)
 
 __all__ = (router,)
@@ -9,10 +9,9 @@ async def check_piston_language_version(language: str, version: str):
     Raises an :class:`fastapi.HTTPException` otherwise with a 404 status code.
     """
 
-    runtimes = await piston.get_runtime(language)
-    if not runtimes:
+    index = await piston.get_runtime_index()
+    if not index.get(language):
         raise HTTPException(404, "Piston language not found")
 
-    versions = [runtime.version for runtime in runtimes]
-    if version not in versions:
+    if not index.has_version(language, version):
         raise HTTPException(404, "Piston language version not found")
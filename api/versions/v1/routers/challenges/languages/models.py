@@ -12,6 +12,11 @@ class ChallengeLanguageResponse(BaseModel):
     piston_lang_ver: str
 
 
+class ChallengeLanguageUsageResponse(BaseModel):
+    id: str
+    challenges: int
+
+
 class NewChallengeLanguageBody(BaseModel):
     name: str = Field(..., min_length=4, max_length=32)
     download_url: Optional[HttpUrl] = None
@@ -1,16 +1,18 @@
 from typing import List
 
 import asyncpg
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Request, Response
 
 import utils
-from api.dependencies import has_permissions
+from api.dependencies import effective_permissions, read_pool
 from api.models import ChallengeLanguage
 from api.models.permissions import ManageWeeklyChallengeLanguages
+from api.services import collections
 
 from .helpers import check_piston_language_version
 from .models import (
     ChallengeLanguageResponse,
+    ChallengeLanguageUsageResponse,
     NewChallengeLanguageBody,
     UpdateChallengeLanguageBody,
 )
@@ -23,18 +25,44 @@ router = APIRouter(prefix="/languages")
     tags=["challenge languages"],
     response_model=List[ChallengeLanguageResponse],
 )
-async def fetch_all_languages():
+async def fetch_all_languages(request: Request):
     """Fetch all the weekly challenge languages, ordered alphabetically."""
 
+    # Rendered on the primary, the rendering is cached until the languages change again.
+    async def render() -> bytes:
+        query = """
+            SELECT l.id::TEXT, l.name, l.download_url, l.disabled, l.piston_lang, l.piston_lang_ver
+              FROM challengelanguages l
+        """
+
+        return await collections.render_query(
+            List[ChallengeLanguageResponse], query, order_by="t.name"
+        )
+
+    return await collections.respond(request, "languages", render)
+
+
+@router.get(
+    "/usage",
+    tags=["challenge languages"],
+    response_model=List[ChallengeLanguageUsageResponse],
+)
+async def fetch_all_languages_usage(pool=read_pool()):
+    """Fetch the amount of challenges using each weekly challenge language."""
+
     query = """
-        SELECT *,
-               l.id::TEXT
+        SELECT l.id::TEXT,
+               COUNT(c.id) AS challenges
           FROM challengelanguages l
-         ORDER BY name
+          LEFT JOIN challenges c ON c.language_ids @> ARRAY[l.id]
+         GROUP BY l.id
+         ORDER BY l.name
     """
-    records = await ChallengeLanguage.pool.fetch(query)
+    records = await pool.fetch(query)
 
-    return [dict(record) for record in records]
+    return utils.TrustedJSONResponse(
+        [dict(record) for record in records], List[ChallengeLanguageUsageResponse]
+    )
 
 
 @router.get(
@@ -45,7 +73,7 @@ async def fetch_all_languages():
         404: {"description": "Language not found"},
     },
 )
-async def fetch_language(id: int):
+async def fetch_language(id: int, pool=read_pool()):
     """Fetch a weekly challenge language by its id."""
 
     query = """
@@ -54,7 +82,32 @@ async def fetch_language(id: int):
           FROM challengelanguages l
          WHERE l.id = $1
     """
-    record = await ChallengeLanguage.pool.fetchrow(query, id)
+    record = await pool.fetchrow(query, id)
+
+    if not record:
+        raise HTTPException(404, "Language not found")
+
+    return dict(record)
+
+
+@router.get(
+    "/{id}/usage",
+    tags=["challenge languages"],
+    response_model=ChallengeLanguageUsageResponse,
+    responses={
+        404: {"description": "Language not found"},
+    },
+)
+async def fetch_language_usage(id: int, pool=read_pool()):
+    """Fetch the amount of challenges using a weekly challenge language."""
+
+    query = """
+        SELECT l.id::TEXT,
+               (SELECT COUNT(*) FROM challenges c WHERE c.language_ids @> ARRAY[l.id]) AS challenges
+          FROM challengelanguages l
+         WHERE l.id = $1
+    """
+    record = await pool.fetchrow(query, id)
 
     if not record:
         raise HTTPException(404, "Language not found")
@@ -75,7 +128,7 @@ async def fetch_language(id: int):
     },
     status_code=201,
     response_class=utils.JSONResponse,
-    dependencies=[has_permissions([ManageWeeklyChallengeLanguages()])],
+    dependencies=[effective_permissions([ManageWeeklyChallengeLanguages()])],
 )
 async def create_language(body: NewChallengeLanguageBody):
     """Create a weekly challenge language."""
@@ -100,6 +153,7 @@ async def create_language(body: NewChallengeLanguageBody):
     except asyncpg.exceptions.UniqueViolationError:
         raise HTTPException(409, "Language with that name already exists")
 
+    await collections.bump("languages")
     return dict(record)
 
 
@@ -114,7 +168,7 @@ async def create_language(body: NewChallengeLanguageBody):
         409: {"description": "Language with that name already exists"},
     },
     status_code=204,
-    dependencies=[has_permissions([ManageWeeklyChallengeLanguages()])],
+    dependencies=[effective_permissions([ManageWeeklyChallengeLanguages()])],
 )
 async def update_language(id: int, body: UpdateChallengeLanguageBody):
     """Update a weekly challenge language."""
@@ -144,6 +198,8 @@ async def update_language(id: int, body: UpdateChallengeLanguageBody):
         except asyncpg.exceptions.UniqueViolationError:
             raise HTTPException(409, "Language with that name already exists")
 
+        await collections.bump("languages")
+
     return Response(status_code=204, content="")
 
 
@@ -157,27 +213,28 @@ async def update_language(id: int, body: UpdateChallengeLanguageBody):
         404: {"description": "Language not found"},
     },
     status_code=204,
-    dependencies=[has_permissions([ManageWeeklyChallengeLanguages()])],
+    dependencies=[effective_permissions([ManageWeeklyChallengeLanguages()])],
 )
 async def delete_language(id: int):
     """Delete a weekly challenge language, if it hasn't been used in any challenges."""
-    query = "SELECT * FROM challengelanguages WHERE id = $1"
+    query = """
+        SELECT EXISTS (
+            SELECT 1 FROM challenges WHERE language_ids @> ARRAY[l.id]
+        ) AS used
+          FROM challengelanguages l
+         WHERE l.id = $1
+    """
     record = await ChallengeLanguage.pool.fetchrow(query, id)
 
     if not record:
         raise HTTPException(404, "Language not found")
 
-    # language = ChallengeLanguage(**record)
-
-    query = """
-        SELECT * FROM challenges WHERE $1 = ANY(language_ids)
-    """
-    records = await ChallengeLanguage.pool.fetch(query, id)
-    if records:
+    if record["used"]:
         raise HTTPException(403, "Language used in a challenge")
 
     await ChallengeLanguage.pool.execute(
         "DELETE FROM challengelanguages WHERE id = $1", id
     )
+    await collections.bump("languages")
 
     return Response(status_code=204, content="")
@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class NewSubmissionBody(BaseModel):
+    language_id: int
+    code: str = Field(..., min_length=1, max_length=65536)
+
+
+class TestCaseResult(BaseModel):
+    test_case_id: str
+    passed: bool
+    error: Optional[str]
+
+
+class SubmissionResponse(BaseModel):
+    id: str
+    challenge_id: str
+    language_id: str
+    status: str
+    passed: Optional[int]
+    total: Optional[int]
+    results: Optional[List[TestCaseResult]]
+    created_at: datetime
+    graded_at: Optional[datetime]
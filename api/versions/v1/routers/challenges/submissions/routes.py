@@ -0,0 +1,82 @@
+from fastapi import APIRouter, HTTPException, Response
+
+from api.dependencies import authorization
+from api.models import Challenge, User
+from api.services import ratelimit, submissions
+
+from .models import NewSubmissionBody, SubmissionResponse
+
+router = APIRouter()
+
+
+@router.post(
+    "/{challenge_id}/submissions",
+    tags=["challenge submissions"],
+    response_model=SubmissionResponse,
+    responses={
+        202: {"description": "Submission queued for grading"},
+        400: {"description": "Language can't be used for this challenge"},
+        401: {"description": "Unauthorized"},
+        404: {"description": "Challenge not found"},
+    },
+    status_code=202,
+)
+@ratelimit.cost(10)
+async def create_submission(
+    challenge_id: int,
+    body: NewSubmissionBody,
+    response: Response,
+    user: User = authorization(),
+):
+    """Queue a submission to a weekly challenge for grading, poll its status with the `Location` header."""
+
+    query = "SELECT language_ids FROM challenges WHERE id = $1"
+    challenge = await Challenge.pool.fetchrow(query, challenge_id)
+
+    if not challenge:
+        raise HTTPException(404, "Challenge not found")
+
+    if body.language_id not in challenge["language_ids"]:
+        raise HTTPException(400, "Language can't be used for this challenge")
+
+    query = """
+        INSERT INTO challengesubmissions (challenge_id, user_id, language_id, code)
+            VALUES ($1, $2, $3, $4)
+            RETURNING id;
+    """
+    submission_id = await Challenge.pool.fetchval(
+        query, challenge_id, user.id, body.language_id, body.code
+    )
+    await submissions.enqueue(submission_id)
+
+    response.headers["Location"] = "/api/v1/challenges/submissions/%s" % submission_id
+    return await fetch_submission(submission_id, user)
+
+
+@router.get(
+    "/submissions/{id}",
+    tags=["challenge submissions"],
+    response_model=SubmissionResponse,
+    responses={
+        401: {"description": "Unauthorized"},
+        404: {"description": "Submission not found"},
+    },
+)
+async def fetch_submission(id: int, user: User = authorization()):
+    """Fetch the grading status of one of your submissions."""
+
+    query = """
+        SELECT *,
+               s.id::TEXT,
+               s.challenge_id::TEXT,
+               s.language_id::TEXT
+          FROM challengesubmissions s
+         WHERE s.id = $1
+           AND s.user_id = $2
+    """
+    record = await Challenge.pool.fetchrow(query, id, user.id)
+
+    if not record:
+        raise HTTPException(404, "Submission not found")
+
+    return dict(record)
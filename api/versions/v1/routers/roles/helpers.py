@@ -0,0 +1,10 @@
+from asyncpg import Connection
+
+
+# Key of the advisory lock held by every transaction writing role positions.
+ROLE_POSITIONS_LOCK = 0x726F6C6573  # "roles"
+
+
+async def lock_role_positions(con: Connection) -> None:
+    """Serialize writers of role positions until the end of the current transaction."""
+    await con.execute("SELECT pg_advisory_xact_lock($1)", ROLE_POSITIONS_LOCK)
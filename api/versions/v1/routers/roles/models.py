@@ -11,7 +11,8 @@ class RoleResponse(BaseModel):
 
 
 class DetailedRoleResponse(RoleResponse):
-    members: List[str]
+    member_count: int
+    members: Optional[List[str]]
 
 
 class NewRoleBody(BaseModel):
@@ -25,3 +26,17 @@ class UpdateRoleBody(BaseModel):
     color: Optional[int] = Field(None, le=0xFFFFFF, ge=0)
     permissions: int = Field(0, ge=0)
     position: int = Field(0, ge=0)
+
+
+class RolePositionBody(BaseModel):
+    id: int
+    position: int = Field(..., ge=1)
+
+
+class RoleMembersBody(BaseModel):
+    ids: List[int] = Field(..., min_items=1, max_items=10000)
+
+
+class RoleMemberOutcome(BaseModel):
+    id: str
+    status: str
@@ -1,16 +1,22 @@
 import utils
 import asyncpg
 
-from typing import List, Union
-from fastapi import APIRouter, HTTPException, Response
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 
 from api.models import Role, UserRole
-from api.dependencies import has_permissions
+from api.dependencies import effective_permissions, read_pool, request_loaders
+from api.services import collections, ratelimit, permissions as permission_cache
+from api.services.loaders import Loaders
 from api.models.permissions import ManageRoles
+from api.versions.v1.routers.roles.helpers import lock_role_positions
 from api.versions.v1.routers.roles.models import (
     NewRoleBody,
     RoleResponse,
     UpdateRoleBody,
+    RolePositionBody,
+    RoleMembersBody,
+    RoleMemberOutcome,
     DetailedRoleResponse,
 )
 
@@ -19,49 +25,114 @@ router = APIRouter(prefix="/roles")
 
 
 @router.get("", tags=["roles"], response_model=List[RoleResponse])
-async def fetch_all_roles():
+async def fetch_all_roles(request: Request):
     """Fetch all roles"""
 
-    query = """
-        SELECT *,
-               r.id::TEXT
-          FROM roles r
-    """
-    records = await Role.pool.fetch(query)
+    # Rendered on the primary, the rendering is cached until the roles change again.
+    async def render() -> bytes:
+        query = """
+            SELECT r.id::TEXT, r.name, r.position, r.permissions, r.color
+              FROM roles r
+        """
+
+        return await collections.render_query(List[RoleResponse], query)
 
-    return [dict(record) for record in records]
+    return await collections.respond(request, "roles", render)
 
 
 @router.get(
     "/{id}",
     tags=["roles"],
     response_model=DetailedRoleResponse,
+    response_model_exclude_unset=True,
     responses={
         404: {"description": "Role not found"},
     },
 )
-async def fetch_role(id: int):
-    """Fetch a role by its id"""
+async def fetch_role(id: int, members: bool = False, pool=read_pool()):
+    """
+    Fetch a role by its id.
+
+    The ids of all the members are only included when `members` is true,
+    use `/roles/{id}/members` to page through the members of big roles.
+    """
 
     query = """
         SELECT *,
                id::TEXT,
-               COALESCE(
-                  (
-                      SELECT json_agg(ur.user_id::TEXT)
-                       FROM userroles ur
-                      WHERE ur.role_id = r.id
-                  ), '[]'
-               ) members
+               (
+                   SELECT COUNT(*)
+                     FROM userroles ur
+                    WHERE ur.role_id = r.id
+               ) member_count,
+               CASE WHEN $2 THEN
+                   COALESCE(
+                      (
+                          SELECT json_agg(ur.user_id::TEXT)
+                           FROM userroles ur
+                          WHERE ur.role_id = r.id
+                      ), '[]'
+                   )
+               END members
          FROM roles r
         WHERE r.id = $1
     """
-    record = await Role.pool.fetchrow(query, id)
+    record = await pool.fetchrow(query, id, members)
 
     if not record:
         raise HTTPException(404, "Role not found")
 
-    return dict(record)
+    data = dict(record)
+    if not members:
+        data.pop("members")
+
+    return data
+
+
+@router.get(
+    "/{id}/members",
+    tags=["roles"],
+    response_model=List[str],
+    responses={
+        404: {"description": "Role not found"},
+    },
+)
+async def fetch_role_members(
+    id: int,
+    after: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    pool=read_pool(),
+):
+    """
+    Fetch the ids of the members of a role, ordered by id.
+
+    Pass the last id of a page as `after` to get the next page.
+    """
+
+    query = """
+        SELECT ur.user_id::TEXT
+          FROM userroles ur
+         WHERE ur.role_id = $1
+           %s
+         ORDER BY ur.user_id
+         LIMIT $2
+    """ % ("AND ur.user_id > $3" if after is not None else "")
+    args = (id, limit) if after is None else (id, limit, after)
+    body = await collections.render_query(
+        List[str],
+        query,
+        *args,
+        column="user_id",
+        order_by="t.user_id::BIGINT",
+        pool=pool,
+    )
+
+    if body == b"[]" and not await pool.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM roles WHERE id = $1)", id
+    ):
+        raise HTTPException(404, "Role not found")
+
+    return Response(content=body, media_type="application/json")
 
 
 @router.post(
@@ -76,31 +147,125 @@ async def fetch_role(id: int):
     },
     status_code=201,
 )
-async def create_role(body: NewRoleBody, roles=has_permissions([ManageRoles()])):
+async def create_role(body: NewRoleBody, perms=effective_permissions([ManageRoles()])):
     # Check if the user has administrator permission or all the permissions provided in the role
-    user_permissions = 0
-    for role in roles:
-        user_permissions |= role.permissions
-
-    if not utils.has_permission(user_permissions, body.permissions):
+    if not utils.has_permission(perms.permissions, body.permissions):
         raise HTTPException(403, "Missing Permissions")
 
+    # Positions are dense, so the next one is the highest + 1 (an index lookup).
+    # Holding the positions lock keeps concurrent creates from getting the same one.
     query = """
         INSERT INTO roles (id, name, color, permissions, position)
-            VALUES (create_snowflake(), $1, $2, $3, (SELECT COUNT(*) FROM roles) + 1)
+            VALUES (
+                create_snowflake(), $1, $2, $3,
+                (SELECT COALESCE(MAX(position), 0) + 1 FROM roles)
+            )
             RETURNING *;
     """
 
     try:
-        record = await Role.pool.fetchrow(
-            query, body.name, body.color, body.permissions
-        )
+        async with Role.pool.acquire() as con:
+            async with con.transaction():
+                await lock_role_positions(con)
+                record = await con.fetchrow(
+                    query, body.name, body.color, body.permissions
+                )
     except asyncpg.exceptions.UniqueViolationError:
         raise HTTPException(409, "Role with that name already exists")
 
+    await collections.bump("roles")
     return utils.JSONResponse(status_code=201, content=dict(record))
 
 
+@router.patch(
+    "",
+    tags=["roles"],
+    responses={
+        204: {"description": "Roles Reordered Successfully"},
+        400: {"description": "Duplicate or out of range positions"},
+        401: {"description": "Unauthorized"},
+        403: {"description": "Missing Permissions"},
+        404: {"description": "Role not found"},
+    },
+    status_code=204,
+)
+async def update_role_positions(
+    body: List[RolePositionBody],
+    perms=effective_permissions([ManageRoles()]),
+):
+    """
+    Move multiple roles at once, every role in the body ends up at its position
+    and the other roles fill the remaining positions in their current order.
+    """
+    ids = [role.id for role in body]
+    positions = [role.position for role in body]
+
+    if len(set(ids)) != len(ids) or len(set(positions)) != len(positions):
+        raise HTTPException(400, "Duplicate roles or positions")
+
+    if any(position <= perms.top_position for position in positions):
+        raise HTTPException(403, "Missing Permissions")
+
+    async with Role.pool.acquire() as con:
+        async with con.transaction():
+            await lock_role_positions(con)
+
+            query = """
+                SELECT r.position,
+                       (SELECT COUNT(*) FROM roles) AS count
+                  FROM roles r
+                 WHERE r.id = ANY($1::BIGINT[])
+                   FOR UPDATE
+            """
+            records = await con.fetch(query, ids)
+
+            if len(records) != len(ids):
+                raise HTTPException(404, "Role Not Found")
+
+            if any(record["position"] <= perms.top_position for record in records):
+                raise HTTPException(403, "Missing Permissions")
+
+            if records and max(positions) > records[0]["count"]:
+                raise HTTPException(400, "Position out of range")
+
+            query = """
+                WITH moved AS (
+                    SELECT *
+                      FROM UNNEST($1::BIGINT[], $2::INT[]) AS m (id, position)
+                ),
+                     free AS (
+                    SELECT slot,
+                           ROW_NUMBER() OVER (ORDER BY slot) AS n
+                      FROM generate_series(1, (SELECT COUNT(*) FROM roles)) slot
+                     WHERE slot NOT IN (SELECT position FROM moved)
+                ),
+                     rest AS (
+                    SELECT r.id,
+                           ROW_NUMBER() OVER (ORDER BY r.position) AS n
+                      FROM roles r
+                     WHERE r.id NOT IN (SELECT id FROM moved)
+                ),
+                     new_positions AS (
+                    SELECT id, position FROM moved
+                     UNION ALL
+                    SELECT rest.id, free.slot FROM rest JOIN free USING (n)
+                )
+                UPDATE roles r SET
+                    position = np.position
+                  FROM new_positions np
+                 WHERE r.id = np.id
+                   AND r.position != np.position
+                RETURNING r.id
+            """
+            updated = await con.fetch(query, ids, positions)
+
+    if updated:
+        await collections.bump("roles")
+        await permission_cache.invalidate_all()
+
+    return Response(status_code=204, content="")
+
+
 @router.patch(
     "/{id}",
     tags=["roles"],
@@ -116,23 +281,19 @@ async def create_role(body: NewRoleBody, roles=has_permissions([ManageRoles()]))
 async def update_role(
     id: int,
     body: UpdateRoleBody,
-    roles=has_permissions([ManageRoles()]),
+    perms=effective_permissions([ManageRoles()]),
+    loaders: Loaders = request_loaders(),
 ):
-    role = await Role.fetch(id)
+    role = await loaders.roles.load(id)
     if not role:
         raise HTTPException(404, "Role Not Found")
 
-    # Check if the user has administrator permission or all the permissions provided in the role
-    user_permissions = 0
-    for r in roles:
-        user_permissions |= r.permissions
-
-    top_role = min(roles, key=lambda role: role.position)
-    if top_role.position >= role.position:
+    if perms.top_position >= role.position:
         raise HTTPException(403, "Missing Permissions")
 
+    # Check if the user has administrator permission or all the permissions provided in the role
     data = body.dict(exclude_unset=True)
-    if not utils.has_permission(user_permissions, body.permissions):
+    if not utils.has_permission(perms.permissions, body.permissions):
         raise HTTPException(403, "Missing Permissions")
 
     if name := data.get("name", None):
@@ -144,7 +305,7 @@ async def update_role(
     if (
         position := data.pop("position", None)
     ) is not None and position != role.position:
-        if position <= top_role.position:
+        if position <= perms.top_position:
             raise HTTPException(403, "Missing Permissions")
 
         if position > role.position:
@@ -152,24 +313,30 @@ async def update_role(
         else:
             new_pos = position - 0.5
 
-        query = """
-            UPDATE roles r SET position = $1
-                WHERE r.id = $2;
-        """
-        await Role.pool.execute(query, new_pos, id)
-
-        query = """
-            WITH todo AS (
-                SELECT r.id,
-                    ROW_NUMBER() OVER (ORDER BY position) AS position
-                FROM roles r
-            )
-            UPDATE roles r SET
-                position = td.position
-            FROM todo td
-            WHERE r.id = td.id;
-        """
-        await Role.pool.execute(query)
+        async with Role.pool.acquire() as con:
+            async with con.transaction():
+                await lock_role_positions(con)
+
+                query = """
+                    UPDATE roles r SET position = $1
+                        WHERE r.id = $2;
+                """
+                await con.execute(query, new_pos, id)
+
+                query = """
+                    WITH todo AS (
+                        SELECT r.id,
+                            ROW_NUMBER() OVER (ORDER BY position) AS position
+                        FROM roles r
+                    )
+                    UPDATE roles r SET
+                        position = td.position
+                    FROM todo td
+                    WHERE r.id = td.id;
+                """
+                await con.execute(query)
+
+        await permission_cache.invalidate_all()
 
     if data:
         query = "UPDATE ROLES SET "
@@ -178,6 +345,10 @@ async def update_role(
 
         await Role.pool.execute(query, id, *data.values())
 
+        if "permissions" in data:
+            await permission_cache.invalidate_role(id)
+
+    await collections.bump("roles")
     return Response(status_code=204, content="")
 
 
@@ -192,13 +363,16 @@ async def update_role(
     },
     status_code=204,
 )
-async def delete_role(id: int, roles=has_permissions([ManageRoles()])):
-    role = await Role.fetch(id)
+async def delete_role(
+    id: int,
+    perms=effective_permissions([ManageRoles()]),
+    loaders: Loaders = request_loaders(),
+):
+    role = await loaders.roles.load(id)
     if not role:
         raise HTTPException(404, "Role Not Found")
 
-    top_role = min(roles, key=lambda role: role.position)
-    if top_role.position >= role.position:
+    if perms.top_position >= role.position:
         raise HTTPException(403, "Missing Permissions")
 
     query = """
@@ -218,11 +392,139 @@ async def delete_role(id: int, roles=has_permissions([ManageRoles()])):
         FROM to_update tu
         WHERE r.id = tu.id
     """
-    await Role.pool.execute(query, id)
+    async with Role.pool.acquire() as con:
+        async with con.transaction():
+            await lock_role_positions(con)
+            await con.execute(query, id)
+
+    await collections.bump("roles")
+    await permission_cache.invalidate_all()
 
     return Response(status_code=204, content="")
 
 
+@router.put(
+    "/{role_id}/members",
+    tags=["roles"],
+    response_model=List[RoleMemberOutcome],
+    responses={
+        401: {"description": "Unauthorized"},
+        403: {"description": "Missing Permissions"},
+        404: {"description": "Role not found"},
+    },
+)
+@ratelimit.cost(5)
+async def add_members_to_role(
+    role_id: int,
+    body: RoleMembersBody,
+    perms=effective_permissions([ManageRoles()]),
+    loaders: Loaders = request_loaders(),
+):
+    """
+    Assign a role to multiple members at once.
+
+    The status of each id is `added`, `already_present` or `unknown_user`.
+    """
+    role = await loaders.roles.load(role_id)
+    if not role:
+        raise HTTPException(404, "Role Not Found")
+
+    if perms.top_position >= role.position:
+        raise HTTPException(403, "Missing Permissions")
+
+    query = """
+        WITH input AS (
+            SELECT DISTINCT UNNEST($2::BIGINT[]) AS user_id
+        ),
+             inserted AS (
+            INSERT INTO userroles (user_id, role_id)
+                SELECT i.user_id, $1
+                  FROM input i
+                  JOIN users u ON u.id = i.user_id
+                ON CONFLICT DO NOTHING
+                RETURNING user_id
+        )
+        SELECT i.user_id,
+               CASE
+                   WHEN ins.user_id IS NOT NULL THEN 'added'
+                   WHEN u.id IS NULL THEN 'unknown_user'
+                   ELSE 'already_present'
+               END AS status
+          FROM input i
+          LEFT JOIN users u ON u.id = i.user_id
+          LEFT JOIN inserted ins ON ins.user_id = i.user_id
+    """
+    try:
+        records = await Role.pool.fetch(query, role_id, body.ids)
+    except asyncpg.exceptions.ForeignKeyViolationError:
+        raise HTTPException(404, "Role Not Found")
+
+    await permission_cache.invalidate(
+        *(r["user_id"] for r in records if r["status"] == "added")
+    )
+
+    return [{"id": str(r["user_id"]), "status": r["status"]} for r in records]
+
+
+@router.delete(
+    "/{role_id}/members",
+    tags=["roles"],
+    response_model=List[RoleMemberOutcome],
+    responses={
+        401: {"description": "Unauthorized"},
+        403: {"description": "Missing Permissions"},
+        404: {"description": "Role not found"},
+    },
+)
+@ratelimit.cost(5)
+async def remove_members_from_role(
+    role_id: int,
+    body: RoleMembersBody,
+    perms=effective_permissions([ManageRoles()]),
+    loaders: Loaders = request_loaders(),
+):
+    """
+    Remove a role from multiple members at once.
+
+    The status of each id is `removed`, `not_present` or `unknown_user`.
+    """
+    role = await loaders.roles.load(role_id)
+    if not role:
+        raise HTTPException(404, "Role Not Found")
+
+    if perms.top_position >= role.position:
+        raise HTTPException(403, "Missing Permissions")
+
+    query = """
+        WITH input AS (
+            SELECT DISTINCT UNNEST($2::BIGINT[]) AS user_id
+        ),
+             deleted AS (
+            DELETE FROM userroles ur
+                 USING input i
+                 WHERE ur.role_id = $1
+                   AND ur.user_id = i.user_id
+                RETURNING ur.user_id
+        )
+        SELECT i.user_id,
+               CASE
+                   WHEN d.user_id IS NOT NULL THEN 'removed'
+                   WHEN u.id IS NULL THEN 'unknown_user'
+                   ELSE 'not_present'
+               END AS status
+          FROM input i
+          LEFT JOIN users u ON u.id = i.user_id
+          LEFT JOIN deleted d ON d.user_id = i.user_id
+    """
+    records = await Role.pool.fetch(query, role_id, body.ids)
+
+    await permission_cache.invalidate(
+        *(r["user_id"] for r in records if r["status"] == "removed")
+    )
+
+    return [{"id": str(r["user_id"]), "status": r["status"]} for r in records]
+
+
 @router.put(
     "/{role_id}/members/{member_id}",
     tags=["roles"],
@@ -236,14 +538,16 @@ async def delete_role(id: int, roles=has_permissions([ManageRoles()])):
     status_code=204,
 )
 async def add_member_to_role(
-    role_id: int, member_id: int, roles=has_permissions([ManageRoles()])
+    role_id: int,
+    member_id: int,
+    perms=effective_permissions([ManageRoles()]),
+    loaders: Loaders = request_loaders(),
 ) -> Union[Response, utils.JSONResponse]:
-    role = await Role.fetch(role_id)
+    role = await loaders.roles.load(role_id)
     if not role:
         raise HTTPException(404, "Role Not Found")
 
-    top_role = min(roles, key=lambda role: role.position)
-    if top_role.position >= role.position:
+    if perms.top_position >= role.position:
         raise HTTPException(403, "Missing Permissions")
 
     try:
@@ -253,6 +557,8 @@ async def add_member_to_role(
     except asyncpg.exceptions.ForeignKeyViolationError:
         raise HTTPException(404, "Member not found")
 
+    await permission_cache.invalidate(member_id)
+
     return Response(status_code=204, content="")
 
 
@@ -268,16 +574,19 @@ async def add_member_to_role(
     status_code=204,
 )
 async def remove_member_from_role(
-    role_id: int, member_id: int, roles=has_permissions([ManageRoles()])
+    role_id: int,
+    member_id: int,
+    perms=effective_permissions([ManageRoles()]),
+    loaders: Loaders = request_loaders(),
 ) -> Union[Response, utils.JSONResponse]:
-    role = await Role.fetch(role_id)
+    role = await loaders.roles.load(role_id)
     if not role:
         raise HTTPException(404, "Role Not Found")
 
-    top_role = min(roles, key=lambda role: role.position)
-    if top_role.position >= role.position:
+    if perms.top_position >= role.position:
         raise HTTPException(403, "Missing Permissions")
 
     await UserRole.delete(member_id, role_id)
+    await permission_cache.invalidate(member_id)
 
     return Response(status_code=204, content="")
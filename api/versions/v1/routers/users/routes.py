@@ -1,21 +1,60 @@
-from fastapi import APIRouter
+from typing import List
+from fastapi import APIRouter, HTTPException, Query
 
 from .models import UserResponse
 
-from api.models import User, UserRole
-from api.dependencies import authorization
+from api.dependencies import authorization, read_pool, token_data
+from api.services import ratelimit
 
 
 router = APIRouter(prefix="/users")
 
+MAX_IDS = 100
+
+USERS_QUERY = """
+    SELECT u.*,
+           u.id::TEXT,
+           COALESCE(
+               ARRAY_AGG(ur.role_id::TEXT) FILTER (WHERE ur.role_id IS NOT NULL), '{}'
+           ) AS roles
+      FROM users u
+      LEFT JOIN userroles ur ON ur.user_id = u.id
+     WHERE u.id = ANY($1::BIGINT[])
+     GROUP BY u.id
+     ORDER BY ARRAY_POSITION($1::BIGINT[], u.id)
+"""
+
+
+@router.get(
+    "",
+    response_model=List[UserResponse],
+    responses={
+        400: {"description": "Too many ids"},
+        401: {"description": "Unauthorized"},
+    },
+)
+@ratelimit.cost(5)
+async def get_users(
+    ids: List[int] = Query(...), user=authorization(), pool=read_pool()
+):
+    """Fetch users by their ids in the provided order, unknown ids are left out."""
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_IDS:
+        raise HTTPException(400, "Can't fetch more than %s users at once" % MAX_IDS)
+
+    records = await pool.fetch(USERS_QUERY, ids)
+
+    return [dict(record) for record in records]
+
 
 @router.get(
     "/@me",
     response_model=UserResponse,
     responses={401: {"description": "Unauthorized"}},
 )
-async def get_current_user(user: User = authorization()):
-    query = """SELECT role_id FROM userroles WHERE user_id = $1;"""
-    roles = [record["role_id"] for record in await UserRole.pool.fetch(query, user.id)]
+async def get_current_user(token=token_data(), pool=read_pool()):
+    record = await pool.fetchrow(USERS_QUERY, [token["uid"]])
+    if not record:
+        raise HTTPException(status_code=401, detail="Invalid token.")
 
-    return {**user.as_dict(), "roles": roles}
+    return dict(record)
@@ -0,0 +1,47 @@
+"""
+Collection rendering benchmark, comparing lists rendered to JSON by PostgreSQL
+with records decoded, converted with `dict()` and rendered in Python.
+
+Needs a database, the rows are generated so no tables are touched.
+Run with `pipenv run python -m benchmarks.passthrough`.
+"""
+from typing import List
+import os
+import time
+
+import config
+from api.services import collections
+from api.versions.v1.routers.roles.models import RoleResponse
+from launch import prepare_postgres, run_async
+
+QUERY = """
+    SELECT g::TEXT AS id,
+           'Role ' || g AS name,
+           g AS position,
+           0 AS permissions,
+           NULL::INTEGER AS color
+      FROM generate_series(1, $1) g
+"""
+
+
+async def bench(name: str, passthrough: bool, rows: int, number: int) -> None:
+    os.environ["JSON_PASSTHROUGH"] = "1" if passthrough else "0"
+
+    started = time.perf_counter()
+    for _ in range(number):
+        await collections.render_query(List[RoleResponse], QUERY, rows)
+    elapsed = time.perf_counter() - started
+
+    print("%-24s %8.2f ms/response" % (name, elapsed / number * 1e3))
+
+
+async def main(number: int = 50):
+    assert await prepare_postgres(db_uri=config.postgres_uri())
+
+    for rows in (100, 1000, 10_000):
+        await bench("dict(record) (%s)" % rows, False, rows, number)
+        await bench("passthrough (%s)" % rows, True, rows, number)
+
+
+if __name__ == "__main__":
+    run_async(main())
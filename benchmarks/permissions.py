@@ -0,0 +1,42 @@
+"""
+Microbenchmarks for the permission helpers in `utils.permissions`.
+
+Run with `pipenv run python -m benchmarks.permissions`.
+"""
+import timeit
+
+import utils
+from api.models.permissions import Administrator, ManageRoles
+
+
+def has_permissions_uncompiled(permissions, required) -> bool:
+    """The previous implementation, building every mask on each call."""
+    if permissions & Administrator().value:
+        return True
+
+    all_perms = 0
+    for perm in required:
+        if isinstance(perm, int):
+            all_perms |= perm
+        else:
+            all_perms |= perm.value
+
+    return permissions & all_perms == all_perms
+
+
+def bench(name: str, func, checks: int, number: int) -> None:
+    seconds = timeit.timeit(func, number=number)
+    print("%-24s %8.1f ns/check" % (name, seconds / (checks * number) * 1e9))
+
+
+def main(number: int = 100_000):
+    required = [ManageRoles()]
+    compiled = utils.compile_permissions(required)
+    mask = ManageRoles().value
+
+    bench("uncompiled", lambda: has_permissions_uncompiled(mask, required), 1, number)
+    bench("compiled", lambda: utils.has_permissions(mask, compiled), 1, number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Latency benchmark for `api.services.ratelimit.hit`, the work the rate limit
+middleware adds to every request, with in-process buckets and with redis
+when `REDIS_URI` is set.
+
+Run with `pipenv run python -m benchmarks.ratelimit`.
+"""
+import os
+import random
+import statistics
+import time
+
+from aioredis import Redis
+
+from api.services import ratelimit, redis
+from launch import run_async
+
+
+async def bench(name: str, amount: int, keys: int) -> None:
+    tier = ratelimit.TIERS["user"]
+    timings = []
+
+    for _ in range(amount):
+        key = str(random.randrange(keys))
+        started = time.perf_counter()
+        await ratelimit.hit(key, tier)
+        timings.append(time.perf_counter() - started)
+
+    percentiles = statistics.quantiles(timings, n=100)
+    print(
+        "%-12s p50 %7.1f µs, p99 %7.1f µs"
+        % (name, percentiles[49] * 1e6, percentiles[98] * 1e6)
+    )
+
+
+async def main(amount: int = 20_000, keys: int = 1000):
+    redis.pool = None
+    await bench("in-process", amount, keys)
+
+    if redis_uri := os.environ.get("REDIS_URI"):
+        redis.pool = Redis.from_url(redis_uri)
+        await bench("redis", amount, keys)
+        await redis.pool.close()
+
+
+if __name__ == "__main__":
+    run_async(main())
@@ -0,0 +1,70 @@
+"""
+Rendering benchmark for `utils.JSONResponse`, comparing it with the previous
+stdlib `json` based renderer on payloads shaped like the list endpoints.
+
+Run with `pipenv run python -m benchmarks.responses`.
+"""
+from functools import partial
+import random
+import timeit
+
+from fastapi.responses import JSONResponse as StdlibJSONResponse
+
+from utils import JSONResponse
+
+
+def roles(amount: int, ids_as_str: bool = True) -> list:
+    return [
+        {
+            "id": str(id) if ids_as_str else id,
+            "name": "Role %s" % i,
+            "color": random.getrandbits(24),
+            "permissions": random.getrandbits(32),
+            "position": i,
+        }
+        for i, id in enumerate(
+            (random.getrandbits(63) for _ in range(amount)), start=1
+        )
+    ]
+
+
+def languages(amount: int) -> list:
+    return [
+        {
+            "id": str(random.getrandbits(63)),
+            "name": "Language %s" % i,
+            "download_url": "https://example.com/languages/%s" % i,
+            "disabled": False,
+            "piston_lang": "python",
+            "piston_lang_ver": "3.10.0",
+        }
+        for i in range(amount)
+    ]
+
+
+def bench(name: str, response_class, content, number: int) -> None:
+    seconds = timeit.timeit(lambda: response_class(content), number=number)
+    print("%-32s %8.1f µs/response" % (name, seconds / number * 1e6))
+
+
+def main(number: int = 200):
+    for amount in (100, 1000, 10_000):
+        role_data = roles(amount)
+        language_data = languages(amount)
+
+        bench("roles (%s) stdlib" % amount, StdlibJSONResponse, role_data, number)
+        bench("roles (%s) orjson" % amount, JSONResponse, role_data, number)
+        bench(
+            "roles (%s) orjson, int ids" % amount,
+            partial(JSONResponse, ints_as_str=True),
+            roles(amount, ids_as_str=False),
+            number,
+        )
+        bench(
+            "languages (%s) stdlib" % amount, StdlibJSONResponse, language_data, number
+        )
+        bench("languages (%s) orjson" % amount, JSONResponse, language_data, number)
+
+
+if __name__ == "__main__":
+    main()
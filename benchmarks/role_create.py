@@ -0,0 +1,76 @@
+"""
+Concurrent role creation benchmark, comparing the previous `COUNT(*) + 1` position
+allocation with the advisory locked `MAX(position) + 1` one used by `create_role`.
+
+Runs against the test database of `TEST_POSTGRES_URI` with the tables created, like the tests,
+as it creates roles and renumbers the positions of all roles afterwards.
+Run with `pipenv run python -m benchmarks.role_create`.
+"""
+import asyncio
+import time
+
+from postDB import Model
+
+import config
+from launch import prepare_postgres, run_async
+from api.versions.v1.routers.roles.helpers import lock_role_positions
+
+COUNT_QUERY = """
+    INSERT INTO roles (id, name, color, permissions, position)
+        VALUES (create_snowflake(), $1, 0, 0, (SELECT COUNT(*) FROM roles) + 1)
+        RETURNING position;
+"""
+LOCKED_QUERY = """
+    INSERT INTO roles (id, name, color, permissions, position)
+        VALUES (create_snowflake(), $1, 0, 0, (SELECT COALESCE(MAX(position), 0) + 1 FROM roles))
+        RETURNING position;
+"""
+
+
+async def create_unlocked(name: str) -> int:
+    return await Model.pool.fetchval(COUNT_QUERY, name)
+
+
+async def create_locked(name: str) -> int:
+    async with Model.pool.acquire() as con:
+        async with con.transaction():
+            await lock_role_positions(con)
+            return await con.fetchval(LOCKED_QUERY, name)
+
+
+async def bench(name: str, create, amount: int) -> None:
+    started = time.perf_counter()
+    positions = await asyncio.gather(
+        *(create("bench %s %s" % (name, i)) for i in range(amount))
+    )
+    elapsed = time.perf_counter() - started
+
+    await Model.pool.execute("DELETE FROM roles WHERE name LIKE 'bench %'")
+    await Model.pool.execute(
+        """
+        WITH todo AS (
+            SELECT r.id, ROW_NUMBER() OVER (ORDER BY position) AS position
+              FROM roles r
+        )
+        UPDATE roles r SET position = td.position FROM todo td WHERE r.id = td.id
+        """
+    )
+
+    print(
+        "%-10s %7.0f creates/s, %s duplicate positions"
+        % (name, amount / elapsed, amount - len(set(positions)))
+    )
+
+
+async def main(amount: int = 1000):
+    if (db_uri := config.test_postgres_uri()) is None:
+        raise SystemExit("TEST_POSTGRES_URI is required, this benchmark changes roles.")
+
+    assert await prepare_postgres(db_uri=db_uri)
+
+    await bench("count", create_unlocked, amount)
+    await bench("locked", create_locked, amount)
+
+
+if __name__ == "__main__":
+    run_async(main())
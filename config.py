@@ -27,6 +27,48 @@ def postgres_uri() -> str:
     raise EnvironmentError('Required environment variable "POSTGRES_URI" is missing')
 
 
+def postgres_min_connections() -> int:
+    """Connections the PostgreSQL pool opens on start and keeps open."""
+    return int(os.environ.get("POSTGRES_MIN_CONNECTIONS", "1"))
+
+
+def postgres_max_connections() -> int:
+    """Maximum amount of connections in the PostgreSQL pool."""
+    return int(os.environ.get("POSTGRES_MAX_CONNECTIONS", "10"))
+
+
+def postgres_statement_cache_size() -> int:
+    """Amount of prepared statements cached by each PostgreSQL connection, 0 disables the cache."""
+    return int(os.environ.get("POSTGRES_STATEMENT_CACHE_SIZE", "100"))
+
+
+def postgres_max_inactive_lifetime() -> float:
+    """Seconds after which idle PostgreSQL connections above the minimum are closed, 0 keeps them open."""
+    return float(os.environ.get("POSTGRES_MAX_INACTIVE_LIFETIME", "300"))
+
+
+def postgres_command_timeout() -> typing.Optional[float]:
+    """Seconds after which PostgreSQL queries are cancelled, no timeout when missing."""
+    value = os.environ.get("POSTGRES_COMMAND_TIMEOUT")
+
+    return float(value) if value else None
+
+
+def postgres_replica_uri() -> typing.Optional[str]:
+    """Connection URI for a read replica of the PostgreSQL database, reads use the primary when missing."""
+    return os.environ.get("POSTGRES_REPLICA_URI") or None
+
+
+def replica_max_lag() -> float:
+    """Seconds the read replica can lag behind before reads fall back to the primary."""
+    return float(os.environ.get("REPLICA_MAX_LAG", "1"))
+
+
+def replica_sticky_seconds() -> int:
+    """Seconds the reads of a user go to the primary after a change they made."""
+    return int(os.environ.get("REPLICA_STICKY_SECONDS", "5"))
+
+
 def secret_key() -> typing.Optional[str]:
     """Key for validating and creating JWT tokens"""
     value = os.environ.get("SECRET_KEY", None)
@@ -98,3 +140,58 @@ def piston_url() -> str:
         )
 
     return value or default
+
+
+def grading_workers() -> int:
+    """Amount of submissions graded at the same time by the in-process grading worker, 0 disables it."""
+    value = os.environ.get("GRADING_WORKERS", "1")
+
+    return int(value)
+
+
+def validate_responses() -> bool:
+    """Whether trusted responses are validated against their model, slow but catches drift."""
+    value = os.environ.get("VALIDATE_RESPONSES", "")
+
+    return value.lower() in ("1", "true", "yes")
+
+
+def json_passthrough() -> bool:
+    """Whether big lists are rendered to JSON by PostgreSQL instead of Python."""
+    value = os.environ.get("JSON_PASSTHROUGH", "1")
+
+    return value.lower() in ("1", "true", "yes")
+
+
+def rate_limits() -> bool:
+    """Whether requests are rate limited."""
+    value = os.environ.get("RATE_LIMITS", "1")
+
+    return value.lower() in ("1", "true", "yes")
+
+
+def forwarded_allow_ips() -> str:
+    """
+    Comma separated addresses of the proxies trusted to set `X-Forwarded-For`,
+    the client address of their requests is taken from that header. `*` trusts every address.
+    """
+    return os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+
+def metrics_allow_ips() -> str:
+    """Comma separated client addresses allowed to read `/api/metrics`, `*` allows every address."""
+    return os.environ.get("METRICS_ALLOW_IPS", "127.0.0.1")
+
+
+def query_warnings() -> bool:
+    """Whether requests exceeding the query budget or repeating queries are logged."""
+    value = os.environ.get("QUERY_WARNINGS", "")
+
+    return value.lower() in ("1", "true", "yes")
+
+
+def query_budget() -> int:
+    """Amount of queries a request can make before it is logged with query warnings."""
+    value = os.environ.get("QUERY_BUDGET", "20")
+
+    return int(value)
@@ -1,15 +1,25 @@
+import multiprocessing
 import logging
 import asyncio
 import asyncpg
+import random
+import signal
 import config
 import click
+import time
+import os
 
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from multiprocessing.synchronize import Event
 from uvicorn import Config, Server
-from typing import Any, Coroutine
+from typing import Any, Callable, Coroutine, List, Optional, Tuple
 from postDB import Model
 
 logging.basicConfig(level=logging.INFO)
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 try:
     import uvloop  # noqa f401
@@ -32,51 +42,208 @@ def run_async(coro: Coroutine) -> Any:
 
 
 async def prepare_postgres(
-    retries: int = 5,
-    interval: float = 10.0,
+    retries: int = 8,
+    interval: float = 1.0,
     db_uri: str = None,
     loop: asyncio.AbstractEventLoop = None,
+    max_interval: float = 30.0,
+    min_con: Optional[int] = None,
+    max_con: Optional[int] = None,
+    statement_cache_size: Optional[int] = None,
+    max_inactive_lifetime: Optional[float] = None,
+    command_timeout: Optional[float] = None,
 ) -> bool:
     """
     Prepare the postgres database connection.
 
-    :param int retries:             Included to fix issue with docker starting API before DB is finished starting.
-    :param float interval:          Interval of which to wait for next retry.
-    :param str db_uri:              DB URI to connect to.
-    :param AbstractEventLoop loop:  Asyncio loop to run the pool with.
+    The pool settings default to their environment variables, see `config.py`.
+
+    :param int retries:                 Included to fix issue with docker starting API before DB is finished starting.
+    :param float interval:              Seconds to wait before the first retry, doubled after every attempt.
+    :param str db_uri:                  DB URI to connect to.
+    :param AbstractEventLoop loop:      Asyncio loop to run the pool with.
+    :param float max_interval:          Maximum seconds to wait between two attempts.
+    :param int min_con:                 Connections opened on start and kept open.
+    :param int max_con:                 Maximum amount of connections.
+    :param int statement_cache_size:    Prepared statements cached by each connection.
+    :param float max_inactive_lifetime: Seconds after which idle connections are closed.
+    :param float command_timeout:       Seconds after which queries are cancelled.
     """
 
     log = logging.getLogger("DB")
     db_name = db_uri.split("/")[-1]
+    min_con = config.postgres_min_connections() if min_con is None else min_con
+    max_con = config.postgres_max_connections() if max_con is None else max_con
+
+    if statement_cache_size is None:
+        statement_cache_size = config.postgres_statement_cache_size()
+    if max_inactive_lifetime is None:
+        max_inactive_lifetime = config.postgres_max_inactive_lifetime()
+    if command_timeout is None:
+        command_timeout = config.postgres_command_timeout()
+
+    from api.services.queries import InstrumentedPool
+
+    # postDB only closes the previous pool when it isn't wrapped.
+    if isinstance(Model.pool, InstrumentedPool):
+        Model.pool = Model.pool._wrapped
+
     log.info('[i] Attempting to connect to DB "%s"' % db_name)
     for i in range(1, retries + 1):
         try:
             await Model.create_pool(
                 uri=db_uri,
-                max_con=10,  # We might want to increase this number in the future.
+                min_con=min_con,
+                max_con=max_con,
                 loop=loop,
+                statement_cache_size=statement_cache_size,
+                max_inactive_connection_lifetime=max_inactive_lifetime,
+                command_timeout=command_timeout,
             )
+            break
 
         except asyncpg.InvalidPasswordError as e:
             log.error("[!] %s" % str(e))
             return False
 
-        except (ConnectionRefusedError,):
-            log.warning(
-                "[!] Failed attempt #%s/%s, trying again in %ss"
-                % (i, retries, interval)
-            )
-
+        except (OSError, asyncpg.CannotConnectNowError):
             if i == retries:
                 log.error("[!] Failed final connection attempt, exiting.")
                 return False
 
-            await asyncio.sleep(interval)
+            # Exponential backoff with jitter, so restarting replicas don't retry in lockstep.
+            delay = min(interval * 2 ** (i - 1), max_interval)
+            delay *= random.uniform(0.5, 1.0)
+
+            log.warning(
+                "[!] Failed attempt #%s/%s, trying again in %.1fs" % (i, retries, delay)
+            )
+            await asyncio.sleep(delay)
+
+    await warm_pool(min_con)
+
+    Model.pool = InstrumentedPool(Model.pool)
+    log.info(
+        '[✔] Connected to database "%s" with %s-%s connections'
+        % (db_name, min_con, max_con)
+    )
+    return True
+
+
+class _ReplicaPool:
+    """Holds the replica pool while postDB creates it, so its connections are set up like the primary's."""
+
+    pool: Optional[asyncpg.pool.Pool] = None
+    create_pool = classmethod(Model.create_pool.__func__)
+
 
-    log.info('[✔] Connected to database "%s"' % db_name)
+async def prepare_replica(
+    db_uri: str,
+    loop: asyncio.AbstractEventLoop = None,
+    min_con: Optional[int] = None,
+    max_con: Optional[int] = None,
+    statement_cache_size: Optional[int] = None,
+    max_inactive_lifetime: Optional[float] = None,
+    command_timeout: Optional[float] = None,
+) -> bool:
+    """
+    Prepare the pool of the read replica, used by read-only routes.
+    Reads keep using the primary when connecting fails.
+
+    The pool is sized like the primary pool, see :func:`prepare_postgres` for the parameters.
+    """
+    from api.services import replica
+    from api.services.queries import InstrumentedPool
+
+    log = logging.getLogger("DB")
+
+    if statement_cache_size is None:
+        statement_cache_size = config.postgres_statement_cache_size()
+    if max_inactive_lifetime is None:
+        max_inactive_lifetime = config.postgres_max_inactive_lifetime()
+    if command_timeout is None:
+        command_timeout = config.postgres_command_timeout()
+
+    if replica.pool is not None:
+        await replica.pool.close()
+        replica.pool = None
+
+    try:
+        await _ReplicaPool.create_pool(
+            uri=db_uri,
+            loop=loop,
+            min_con=config.postgres_min_connections() if min_con is None else min_con,
+            max_con=config.postgres_max_connections() if max_con is None else max_con,
+            statement_cache_size=statement_cache_size,
+            max_inactive_connection_lifetime=max_inactive_lifetime,
+            command_timeout=command_timeout,
+        )
+    except (OSError, asyncpg.PostgresError) as e:
+        log.error(
+            "[!] Failed to connect to the read replica, reading from the primary: %s"
+            % e
+        )
+        return False
+
+    replica.pool = InstrumentedPool(_ReplicaPool.pool)
+    _ReplicaPool.pool = None
+    log.info("[✔] Connected to the read replica")
     return True
 
 
+async def warm_pool(size: int) -> None:
+    """
+    Makes sure `size` connections of the pool are open and usable,
+    so the first requests don't wait on connections being established.
+
+    :param size:    Amount of connections to warm up.
+    """
+    connections = await asyncio.gather(*(Model.pool.acquire() for _ in range(size)))
+
+    try:
+        await asyncio.gather(*(con.execute("SELECT 1") for con in connections))
+    finally:
+        for con in connections:
+            await Model.pool.release(con)
+
+
+async def connection_budget() -> int:
+    """
+    The amount of connections PostgreSQL still accepts from clients, its `max_connections`
+    without the ones reserved for superusers and the ones held by other clients.
+    """
+    return await Model.pool.fetchval(
+        """
+        SELECT CURRENT_SETTING('max_connections')::INT
+             - CURRENT_SETTING('superuser_reserved_connections')::INT
+             - (
+                SELECT COUNT(*)
+                  FROM pg_stat_activity
+                 WHERE backend_type = 'client backend' AND pid <> PG_BACKEND_PID()
+               )
+        """
+    )
+
+
+def worker_pool_size(
+    budget: int, workers: int, min_con: int, max_con: int
+) -> Tuple[int, int]:
+    """
+    Splits the connection budget between the pools of the workers.
+
+    Room is kept for one extra pool, a restarted or reloaded worker connects
+    before the worker it replaces closes its pool.
+
+    :param budget:      Connections PostgreSQL accepts, see :func:`connection_budget`.
+    :param workers:     Amount of worker processes.
+    :param min_con:     Requested minimum connections of each pool.
+    :param max_con:     Requested maximum connections of each pool.
+    :returns:           The minimum and maximum connections of each pool.
+    """
+    max_con = max(min(max_con, budget // (workers + 1)), 1)
+    return min(min_con, max_con), max_con
+
+
 async def safe_create_tables(verbose: bool = False) -> None:
     """
     Safely create all tables using the specified order in `~/api/models/__init__.py`.
@@ -88,7 +255,7 @@ async def safe_create_tables(verbose: bool = False) -> None:
 
     log.info("Attempting to create %s tables." % len(models_ordered))
 
-    with open("snowflake.sql") as f:
+    with open(os.path.join(BASE_DIR, "snowflake.sql")) as f:
         query = f.read()
 
         if verbose:
@@ -100,6 +267,14 @@ async def safe_create_tables(verbose: bool = False) -> None:
         await model.create_table(verbose=verbose)
         log.info("Created table %s" % model.__tablename__)
 
+    with open(os.path.join(BASE_DIR, "schema.sql")) as f:
+        query = f.read()
+
+        if verbose:
+            print(query)
+
+        await Model.pool.execute(query)
+
 
 async def delete_tables(verbose: bool = False):
     """
@@ -110,6 +285,10 @@ async def delete_tables(verbose: bool = False):
 
     log = logging.getLogger("DB")
 
+    await Model.pool.execute(
+        "DROP TABLE IF EXISTS challengesubmissions, challengetestcases CASCADE"
+    )
+
     for model in Model.all_models():
         await model.drop_table(verbose=verbose)
         log.info("Dropped table %s" % type(model).__tablename__)
@@ -118,6 +297,209 @@ async def delete_tables(verbose: bool = False):
     await Model.pool.execute("DROP SEQUENCE IF EXISTS global_snowflake_id_seq")
 
 
+def uvicorn_config(host: str, port: int, debug: bool = False) -> Config:
+    """
+    The uvicorn config running the API. Requests of the proxies in `FORWARDED_ALLOW_IPS`
+    get the client address from their `X-Forwarded-For` header, rate limits rely on it.
+    """
+    return Config(
+        "api.app:app",
+        host=host,
+        port=port,
+        debug=debug,
+        proxy_headers=True,
+        forwarded_allow_ips=config.forwarded_allow_ips(),
+    )
+
+
+def serve_worker(
+    host: str,
+    port: int,
+    debug: bool,
+    verbose: bool,
+    sock,
+    pool_options: dict,
+    ready: Event,
+) -> None:
+    """
+    Runs the API in a worker process started by :class:`Supervisor`,
+    on the socket bound by the supervisor.
+
+    Every worker connects its own database pool, the redis pool and ClientSession
+    are created by the startup handler of the app.
+    """
+    # Ctrl+C is handled by the supervisor, it stops the workers itself.
+    os.setpgrp()
+    config.set_debug(debug)
+
+    if verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    if not run_async(
+        prepare_postgres(db_uri=config.postgres_uri(), loop=loop, **pool_options)
+    ):
+        exit(1)  # Connecting to our postgres server failed.
+
+    if (replica_uri := config.postgres_replica_uri()) is not None:
+        run_async(prepare_replica(replica_uri, loop=loop, **pool_options))
+
+    server = Server(config=uvicorn_config(host, port, debug))
+
+    async def worker():
+        task = loop.create_task(server.serve(sockets=[sock]))
+
+        while not server.started and not task.done():
+            await asyncio.sleep(0.1)
+
+        if server.started:
+            ready.set()
+
+        await task
+
+    run_async(worker())
+
+
+class _Worker:
+    """A worker process, and the event it sets once it accepts connections."""
+
+    def __init__(self, process: BaseProcess, ready: Event):
+        self.process = process
+        self.ready = ready
+        self.started = time.monotonic()
+
+
+class Supervisor:
+    """
+    Runs `target` in `workers` processes, restarting the ones which exit.
+
+    Workers crashing right after starting are restarted with an increasing delay.
+    SIGHUP replaces the workers one by one, the old worker is only stopped once the new one is ready.
+    SIGINT and SIGTERM stop the workers gracefully, killing the ones still running after `timeout` seconds.
+
+    :param workers:     Amount of worker processes.
+    :param target:      Function run by the workers, called with `args` and the ready event.
+    :param args:        Arguments for `target`.
+    :param timeout:     Seconds to wait for workers to start or stop.
+    """
+
+    # Workers exiting within this many seconds of starting count as a failed start.
+    MIN_UPTIME = 10.0
+    MAX_RESTART_DELAY = 60.0
+
+    def __init__(
+        self, workers: int, target: Callable, args: tuple, timeout: float = 30.0
+    ):
+        self.target = target
+        self.args = args
+        self.timeout = timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: List[Optional[_Worker]] = [None] * workers
+        self.failures = [0] * workers
+        self.restart_at = [0.0] * workers
+        self.should_exit = False
+        self.should_reload = False
+        self.log = logging.getLogger("Supervisor")
+
+    def handle_exit(self, sig, frame) -> None:
+        self.should_exit = True
+
+    def handle_reload(self, sig, frame) -> None:
+        self.should_reload = True
+
+    def spawn(self) -> _Worker:
+        ready = self.context.Event()
+        process = self.context.Process(target=self.target, args=(*self.args, ready))
+        process.start()
+
+        self.log.info("[i] Started worker %s" % process.pid)
+        return _Worker(process, ready)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self.handle_exit)
+        signal.signal(signal.SIGTERM, self.handle_exit)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        self.log.info(
+            "[i] Supervisor %s running %s workers" % (os.getpid(), len(self.workers))
+        )
+        while not self.should_exit:
+            if self.should_reload:
+                self.should_reload = False
+                self.reload()
+
+            self.restart_exited()
+
+            sentinels = [worker.process.sentinel for worker in self.workers if worker]
+            if sentinels:
+                wait(sentinels, timeout=0.5)
+            else:
+                time.sleep(0.5)
+
+        self.stop([worker for worker in self.workers if worker])
+
+    def restart_exited(self) -> None:
+        now = time.monotonic()
+
+        for slot, worker in enumerate(self.workers):
+            if worker is not None and not worker.process.is_alive():
+                worker.process.join()
+
+                # Crashing on start likely happens again, like when the database is down.
+                if now - worker.started < self.MIN_UPTIME:
+                    self.failures[slot] += 1
+                else:
+                    self.failures[slot] = 0
+
+                delay = min(2.0 ** self.failures[slot] - 1, self.MAX_RESTART_DELAY)
+                self.log.warning(
+                    "[!] Worker %s exited with code %s, restarting in %.0fs"
+                    % (worker.process.pid, worker.process.exitcode, delay)
+                )
+                self.workers[slot] = None
+                self.restart_at[slot] = now + delay
+
+            if self.workers[slot] is None and now >= self.restart_at[slot]:
+                self.workers[slot] = self.spawn()
+
+    def reload(self) -> None:
+        self.log.info("[i] Reloading %s workers" % len(self.workers))
+
+        for slot, old in enumerate(self.workers):
+            new = self.spawn()
+
+            deadline = time.monotonic() + self.timeout
+            while not new.ready.wait(0.5):
+                if (
+                    self.should_exit
+                    or not new.process.is_alive()
+                    or time.monotonic() > deadline
+                ):
+                    self.log.error(
+                        "[!] Worker %s failed to start, reload aborted"
+                        % new.process.pid
+                    )
+                    self.stop([new])
+                    return
+
+            self.workers[slot] = new
+            if old is not None:
+                self.stop([old])
+
+    def stop(self, workers: List[_Worker]) -> None:
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+        deadline = time.monotonic() + self.timeout
+        for worker in workers:
+            worker.process.join(max(deadline - time.monotonic(), 0))
+
+            if worker.process.is_alive():
+                self.log.warning("[!] Killing worker %s" % worker.process.pid)
+                worker.process.kill()
+                worker.process.join()
+
+
 @click.group()
 def cli():
     pass
@@ -131,11 +513,7 @@ def _initdb(verbose: bool):
 
     :param verbose:     Print SQL statements when creating models?
     """
-    if not run_async(
-        prepare_postgres(
-            retries=6, interval=10.0, db_uri=config.postgres_uri(), loop=loop
-        )
-    ):
+    if not run_async(prepare_postgres(db_uri=config.postgres_uri(), loop=loop)):
         exit(1)  # Connecting to our postgres server failed.
 
     run_async(safe_create_tables(verbose=verbose))
@@ -149,16 +527,55 @@ def _dropdb(verbose: bool):
 
     :param verbose:     Print SQL statements when dropping models?
     """
-    if not run_async(
-        prepare_postgres(
-            retries=6, interval=10.0, db_uri=config.postgres_uri(), loop=loop
-        )
-    ):
+    if not run_async(prepare_postgres(db_uri=config.postgres_uri(), loop=loop)):
         exit(1)  # Connecting to our postgres server failed.
 
     run_async(delete_tables(verbose=verbose))
 
 
+@cli.command(name="worker")
+@click.option("-c", "--concurrency", default=4)
+@click.option("-v", "--verbose", default=False, is_flag=True)
+def _worker(concurrency: int, verbose: bool):
+    """
+    Run a worker grading queued challenge submissions.
+
+    :param concurrency: Amount of submissions graded at the same time.
+    :param verbose:     Set logging to DEBUG instead of INFO
+    """
+    if verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    if (redis_uri := config.redis_uri()) is None:
+        logging.getLogger("Worker").error(
+            "[!] A redis server is required to run a separate worker."
+        )
+        exit(1)
+
+    if not run_async(prepare_postgres(db_uri=config.postgres_uri(), loop=loop)):
+        exit(1)  # Connecting to our postgres server failed.
+
+    async def worker():
+        from aiohttp import ClientSession
+        from aioredis import Redis
+        from api.services import http, redis, submissions
+
+        http.session = ClientSession()
+        redis.pool = Redis.from_url(redis_uri)
+        grader = submissions.Worker(concurrency=concurrency)
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, grader.stop)
+
+        try:
+            await grader.run()
+        finally:
+            await http.session.close()
+            await redis.pool.close()
+
+    run_async(worker())
+
+
 @cli.command()
 @click.option("-p", "--port", default=5000)
 @click.option("-h", "--host", default="0.0.0.0")
@@ -166,31 +583,89 @@ def _dropdb(verbose: bool):
 @click.option("-i", "--initdb", default=False, is_flag=True)
 @click.option("-r", "--resetdb", default=False, is_flag=True)
 @click.option("-v", "--verbose", default=False, is_flag=True)
+@click.option("--min-connections", type=int, default=None)
+@click.option("--max-connections", type=int, default=None)
+@click.option("--statement-cache-size", type=int, default=None)
+@click.option("--max-inactive-lifetime", type=float, default=None)
+@click.option("--command-timeout", type=float, default=None)
+@click.option("-w", "--workers", type=click.IntRange(min=1), default=1)
 def runserver(
-    host: str, port: str, debug: bool, initdb: bool, resetdb: bool, verbose: bool
+    host: str,
+    port: str,
+    debug: bool,
+    initdb: bool,
+    resetdb: bool,
+    verbose: bool,
+    min_connections: Optional[int],
+    max_connections: Optional[int],
+    statement_cache_size: Optional[int],
+    max_inactive_lifetime: Optional[float],
+    command_timeout: Optional[float],
+    workers: int,
 ):
     """
     Run the FastAPI Server.
 
-    :param host:        Host to run it on.
-    :param port:        Port to run it on.
-    :param debug:       Run server in debug mode?
-    :param initdb:      Create models before running API?
-    :param verbose:     Set logging to DEBUG instead of INFO
+    :param host:                    Host to run it on.
+    :param port:                    Port to run it on.
+    :param debug:                   Run server in debug mode?
+    :param initdb:                  Create models before running API?
+    :param verbose:                 Set logging to DEBUG instead of INFO
+    :param min_connections:         Connections the database pool keeps open.
+    :param max_connections:         Maximum connections of the database pool.
+    :param statement_cache_size:    Prepared statements cached by each connection.
+    :param max_inactive_lifetime:   Seconds after which idle connections are closed.
+    :param command_timeout:         Seconds after which queries are cancelled.
+    :param workers:                 Amount of worker processes.
     """
     config.set_debug(debug)
 
     if verbose:
         logging.basicConfig(level=logging.DEBUG)
 
+    if workers > 1:
+        return run_workers(
+            workers,
+            host=host,
+            port=port,
+            debug=debug,
+            initdb=initdb,
+            resetdb=resetdb,
+            verbose=verbose,
+            min_con=min_connections,
+            max_con=max_connections,
+            statement_cache_size=statement_cache_size,
+            max_inactive_lifetime=max_inactive_lifetime,
+            command_timeout=command_timeout,
+        )
+
     if not run_async(
         prepare_postgres(
-            retries=6, interval=10.0, db_uri=config.postgres_uri(), loop=loop
+            db_uri=config.postgres_uri(),
+            loop=loop,
+            min_con=min_connections,
+            max_con=max_connections,
+            statement_cache_size=statement_cache_size,
+            max_inactive_lifetime=max_inactive_lifetime,
+            command_timeout=command_timeout,
         )
     ):
         exit(1)  # Connecting to our postgres server failed.
 
-    server_config = Config("api.app:app", host=host, port=port, debug=debug)
+    if (replica_uri := config.postgres_replica_uri()) is not None:
+        run_async(
+            prepare_replica(
+                replica_uri,
+                loop=loop,
+                min_con=min_connections,
+                max_con=max_connections,
+                statement_cache_size=statement_cache_size,
+                max_inactive_lifetime=max_inactive_lifetime,
+                command_timeout=command_timeout,
+            )
+        )
+
+    server_config = uvicorn_config(host, port, debug)
     server = Server(config=server_config)
 
     async def worker():
@@ -205,5 +680,66 @@ def runserver(
     run_async(worker())
 
 
+def run_workers(
+    workers: int,
+    host: str,
+    port: int,
+    debug: bool,
+    initdb: bool,
+    resetdb: bool,
+    verbose: bool,
+    min_con: Optional[int],
+    max_con: Optional[int],
+    **pool_options,
+) -> None:
+    """
+    Run the API in `workers` processes supervised by this one.
+
+    The tables are created here once, before the workers start, and the pool
+    of each worker is sized so all workers together stay within `max_connections`.
+    """
+    log = logging.getLogger("Supervisor")
+    min_con = config.postgres_min_connections() if min_con is None else min_con
+    max_con = config.postgres_max_connections() if max_con is None else max_con
+
+    if not run_async(
+        prepare_postgres(db_uri=config.postgres_uri(), loop=loop, min_con=1, max_con=1)
+    ):
+        exit(1)  # Connecting to our postgres server failed.
+
+    async def prepare() -> int:
+        if initdb:
+            await safe_create_tables(verbose=verbose)
+        elif resetdb:
+            await delete_tables(verbose=verbose)
+            await safe_create_tables(verbose=verbose)
+
+        try:
+            return await connection_budget()
+        finally:
+            await Model.pool.close()
+
+    budget = run_async(prepare())
+    pool_options["min_con"], pool_options["max_con"] = worker_pool_size(
+        budget, workers, min_con, max_con
+    )
+
+    if pool_options["max_con"] < max_con:
+        log.warning(
+            "[!] Limiting the pool of each worker to %s connections, %s connections are available"
+            % (pool_options["max_con"], budget)
+        )
+
+    sock = uvicorn_config(host, port).bind_socket()
+    supervisor = Supervisor(
+        workers, serve_worker, (host, port, debug, verbose, sock, pool_options)
+    )
+
+    try:
+        supervisor.run()
+    finally:
+        sock.close()
+
+
 if __name__ == "__main__":
     cli()
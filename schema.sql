@@ -0,0 +1,38 @@
+-- Tables and indexes that live outside of the models, executed after the models are created.
+
+CREATE TABLE IF NOT EXISTS challengetestcases (
+    id BIGINT PRIMARY KEY DEFAULT create_snowflake(),
+    challenge_id BIGINT NOT NULL REFERENCES challenges (id) ON DELETE CASCADE,
+    stdin TEXT NOT NULL DEFAULT '',
+    expected_output TEXT NOT NULL,
+    hidden BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE INDEX IF NOT EXISTS challengetestcases_challenge_id_idx
+    ON challengetestcases (challenge_id);
+
+CREATE TABLE IF NOT EXISTS challengesubmissions (
+    id BIGINT PRIMARY KEY DEFAULT create_snowflake(),
+    challenge_id BIGINT NOT NULL REFERENCES challenges (id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    language_id BIGINT NOT NULL REFERENCES challengelanguages (id) ON DELETE CASCADE,
+    code TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    passed INTEGER,
+    total INTEGER,
+    results JSON,
+    created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+    graded_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS challengesubmissions_user_id_idx
+    ON challengesubmissions (user_id);
+
+CREATE INDEX IF NOT EXISTS roles_position_idx
+    ON roles (position);
+
+CREATE INDEX IF NOT EXISTS userroles_role_id_user_id_idx
+    ON userroles (role_id, user_id);
+
+CREATE INDEX IF NOT EXISTS challenges_language_ids_idx
+    ON challenges USING GIN (language_ids);
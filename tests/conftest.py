@@ -7,6 +7,7 @@ from postDB import Model
 from httpx import AsyncClient
 
 from api.models import User
+from utils import TrustedJSONResponse
 from launch import prepare_postgres, safe_create_tables, delete_tables
 
 
@@ -19,12 +20,22 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def validate_responses():
+    """Routes skipping response validation are still validated while testing."""
+    TrustedJSONResponse.validate = True
+    yield
+    TrustedJSONResponse.validate = False
+
+
 @pytest.fixture(scope="session")
 async def app(event_loop: asyncio.AbstractEventLoop) -> AsyncClient:
     from api import app
+    from api.services import ratelimit
 
     async with AsyncClient(app=app, base_url="http://127.0.0.1:8000") as client:
         await app.router.startup()
+        ratelimit.enabled = False
         yield client
         await app.router.shutdown()
 
@@ -37,6 +48,19 @@ async def db(event_loop) -> bool:
     await delete_tables()
 
 
+@pytest.fixture(scope="function", autouse=True)
+async def caches():
+    """Tests change roles and languages directly in the database, so cached data can't outlive a test."""
+    from api.services import collections, permissions, redis
+
+    yield
+    await permissions.invalidate_all()
+
+    if redis.pool is not None:
+        await collections.bump("roles")
+        await collections.bump("languages")
+
+
 @pytest.fixture(scope="function")
 async def user(db):
     yield await User.create(0, "Test", "0001")
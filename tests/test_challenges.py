@@ -368,3 +368,42 @@ async def test_challenge_language_delete_fail_404(
     )
 
     assert res.status_code == 404
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_challenge_language_usage(
+    app: AsyncClient,
+    db,
+    manage_challenges_user: User,
+    language: ChallengeLanguage,
+):
+    query = """
+        INSERT INTO challenges (id, title, slug, author_id, description, example_in, example_out, language_ids)
+            VALUES (create_snowflake(), $1, $2, $3, $4, $5, $6, $7)
+            RETURNING id;
+    """
+    challenge_id = await db.fetchval(
+        query,
+        "Test challenge",
+        "test-challenge",
+        manage_challenges_user.id,
+        "For testing",
+        ["in"],
+        ["out"],
+        [language.id],
+    )
+
+    try:
+        res = await app.get(f"/api/v1/challenges/languages/{language.id}/usage")
+        assert res.status_code == 200
+        assert res.json() == {"id": str(language.id), "challenges": 1}
+
+        res = await app.get("/api/v1/challenges/languages/usage")
+        assert res.status_code == 200
+        assert {"id": str(language.id), "challenges": 1} in res.json()
+    finally:
+        await db.execute("DELETE FROM challenges WHERE id = $1", challenge_id)
+
+    res = await app.get("/api/v1/challenges/languages/0/usage")
+    assert res.status_code == 404
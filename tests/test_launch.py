@@ -0,0 +1,266 @@
+import asyncio
+import pytest
+import signal
+import threading
+
+from types import SimpleNamespace
+from postDB import Model
+from pytest_mock import MockerFixture
+
+import launch
+from api.services.queries import InstrumentedPool
+
+
+@pytest.mark.asyncio
+async def test_prepare_postgres_backoff(mocker: MockerFixture):
+    create_pool = mocker.patch.object(
+        Model, "create_pool", side_effect=[OSError, OSError, None]
+    )
+    sleep = mocker.patch("asyncio.sleep")
+    warm_pool = mocker.patch.object(launch, "warm_pool")
+    mocker.patch.object(Model, "pool", object())
+
+    assert await launch.prepare_postgres(
+        db_uri="postgres://localhost/test", interval=1.0, min_con=2, max_con=4
+    )
+
+    assert create_pool.call_count == 3
+    assert create_pool.call_args.kwargs["max_con"] == 4
+    delays = [call.args[0] for call in sleep.call_args_list]
+    assert 0.5 <= delays[0] <= 1.0 and 1.0 <= delays[1] <= 2.0
+    warm_pool.assert_awaited_once_with(2)
+
+
+@pytest.mark.asyncio
+async def test_prepare_postgres_gives_up(mocker: MockerFixture):
+    mocker.patch.object(Model, "create_pool", side_effect=OSError)
+    mocker.patch("asyncio.sleep")
+
+    assert not await launch.prepare_postgres(
+        db_uri="postgres://localhost/test", retries=3
+    )
+
+
+def test_worker_pool_size():
+    # One pool is kept spare for a worker replacing another.
+    assert launch.worker_pool_size(97, 3, min_con=2, max_con=10) == (2, 10)
+    assert launch.worker_pool_size(40, 4, min_con=2, max_con=10) == (2, 8)
+    assert launch.worker_pool_size(3, 4, min_con=2, max_con=10) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_prepare_postgres_unwraps_pool(mocker: MockerFixture):
+    pool = object()
+    mocker.patch.object(Model, "pool", InstrumentedPool(pool))
+    wrapped = []
+
+    async def create_pool(**kwargs):
+        # postDB closes the previous pool when it's an asyncpg pool.
+        wrapped.append(Model.pool)
+
+    mocker.patch.object(Model, "create_pool", side_effect=create_pool)
+    mocker.patch.object(launch, "warm_pool")
+
+    assert await launch.prepare_postgres(db_uri="postgres://localhost/test")
+    assert wrapped == [pool]
+
+
+class FakeProcess:
+    def __init__(self, name: str, events: list, alive: bool = True):
+        self.name = self.pid = name
+        self.events = events
+        self.alive = alive
+        self.exitcode = None if alive else 1
+        self.sentinel = object()
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+    def join(self, timeout=None) -> None:
+        pass
+
+    def terminate(self) -> None:
+        self.events.append(("stop", self.name))
+        self.alive = False
+        self.exitcode = -15
+
+    def kill(self) -> None:
+        self.events.append(("kill", self.name))
+        self.alive = False
+
+
+class FakeReady:
+    def __init__(self, ready: bool = True):
+        self.ready = ready
+
+    def wait(self, timeout=None) -> bool:
+        return self.ready
+
+
+@pytest.fixture
+def clock(mocker: MockerFixture):
+    """The supervisor's clock, only advanced by tests."""
+    now = [0.0]
+    mocker.patch.object(
+        launch, "time", SimpleNamespace(monotonic=lambda: now[0], sleep=lambda _: None)
+    )
+    return now
+
+
+def supervisor(mocker: MockerFixture, workers: int, events: list, *started):
+    """A supervisor whose spawned workers are the `started` processes, in order."""
+    processes = iter(started)
+
+    def spawn():
+        process = next(processes)
+        events.append(("spawn", process.name))
+        return launch._Worker(process, FakeReady(process.alive))
+
+    supervisor = launch.Supervisor(workers, target=None, args=(), timeout=1.0)
+    mocker.patch.object(supervisor, "spawn", side_effect=spawn)
+    return supervisor
+
+
+def test_supervisor_restarts_crashed_workers(mocker: MockerFixture, clock):
+    events = []
+    first, second, third, fourth = (FakeProcess(name, events) for name in "abcd")
+    supervisor_ = supervisor(mocker, 1, events, first, second, third, fourth)
+
+    supervisor_.restart_exited()
+    assert events == [("spawn", "a")]
+
+    # Crashing right after starting, restarted after 1s and then after 3s.
+    clock[0] = 1.0
+    first.alive = False
+    supervisor_.restart_exited()
+    assert supervisor_.workers == [None]
+
+    clock[0] = 2.0
+    supervisor_.restart_exited()
+    assert events[-1] == ("spawn", "b")
+
+    clock[0] = 3.0
+    second.alive = False
+    supervisor_.restart_exited()
+    clock[0] = 5.9
+    supervisor_.restart_exited()
+    assert supervisor_.workers == [None]
+
+    clock[0] = 6.0
+    supervisor_.restart_exited()
+    assert events[-1] == ("spawn", "c")
+
+    # Running for longer than MIN_UPTIME resets the backoff.
+    clock[0] = 6.0 + launch.Supervisor.MIN_UPTIME
+    third.alive = False
+    supervisor_.restart_exited()
+    assert events[-1] == ("spawn", "d")
+    assert supervisor_.failures == [0]
+
+
+def test_supervisor_rolling_reload(mocker: MockerFixture):
+    events = []
+    supervisor_ = supervisor(
+        mocker, 2, events, FakeProcess("new-1", events), FakeProcess("new-2", events)
+    )
+    supervisor_.workers = [
+        launch._Worker(FakeProcess("old-1", events), FakeReady()),
+        launch._Worker(FakeProcess("old-2", events), FakeReady()),
+    ]
+
+    supervisor_.reload()
+
+    # Every old worker is only stopped once its replacement is ready.
+    assert events == [
+        ("spawn", "new-1"),
+        ("stop", "old-1"),
+        ("spawn", "new-2"),
+        ("stop", "old-2"),
+    ]
+    assert [worker.process.name for worker in supervisor_.workers] == ["new-1", "new-2"]
+
+
+def test_supervisor_reload_aborts(mocker: MockerFixture):
+    events = []
+    supervisor_ = supervisor(mocker, 1, events, FakeProcess("new", events, alive=False))
+    old = supervisor_.workers[0] = launch._Worker(
+        FakeProcess("old", events), FakeReady()
+    )
+
+    supervisor_.reload()
+
+    # The new worker died before it was ready, the old one keeps running.
+    assert supervisor_.workers == [old]
+    assert events == [("spawn", "new")]
+
+
+def test_supervisor_stops_on_sigterm(mocker: MockerFixture):
+    events = []
+    handlers = {}
+    mocker.patch.object(
+        launch.signal, "signal", lambda sig, handler: handlers.update({sig: handler})
+    )
+    supervisor_ = supervisor(
+        mocker, 2, events, FakeProcess("a", events), FakeProcess("b", events)
+    )
+
+    def wait(sentinels, timeout):
+        assert len(sentinels) == 2
+        handlers[signal.SIGTERM](signal.SIGTERM, None)
+
+    mocker.patch.object(launch, "wait", wait)
+    supervisor_.run()
+
+    assert events == [("spawn", "a"), ("spawn", "b"), ("stop", "a"), ("stop", "b")]
+
+
+@pytest.fixture
+def worker_process(mocker: MockerFixture):
+    """Runs :func:`launch.serve_worker` in this process, on its own event loop."""
+    loop = asyncio.new_event_loop()
+    mocker.patch.object(launch, "loop", loop)
+    mocker.patch.object(launch, "run_async", loop.run_until_complete)
+    mocker.patch.object(launch.os, "setpgrp")
+    mocker.patch.object(launch.config, "set_debug")
+    mocker.patch.object(launch.config, "postgres_uri", return_value="postgres://db")
+    mocker.patch.object(launch.config, "postgres_replica_uri", return_value=None)
+    yield
+    loop.close()
+
+
+def test_serve_worker(worker_process, mocker: MockerFixture):
+    ready = threading.Event()
+    sock = object()
+
+    class FakeServer:
+        def __init__(self, config):
+            self.started = False
+
+        async def serve(self, sockets):
+            assert sockets == [sock]
+            self.started = True
+            await asyncio.sleep(0.2)
+
+    mocker.patch.object(launch, "Server", FakeServer)
+    mocker.patch.object(launch, "uvicorn_config")
+    prepare_postgres = mocker.patch.object(
+        launch, "prepare_postgres", return_value=True
+    )
+
+    launch.serve_worker("127.0.0.1", 5000, False, False, sock, {"max_con": 4}, ready)
+
+    assert ready.is_set()
+    assert prepare_postgres.call_args.kwargs["max_con"] == 4
+
+
+def test_serve_worker_without_database(worker_process, mocker: MockerFixture):
+    server = mocker.patch.object(launch, "Server")
+    mocker.patch.object(launch, "prepare_postgres", return_value=False)
+
+    with pytest.raises(SystemExit) as exit_info:
+        launch.serve_worker(
+            "127.0.0.1", 5000, False, False, None, {}, threading.Event()
+        )
+
+    assert exit_info.value.code == 1
+    server.assert_not_called()
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+
+from pytest_mock import MockerFixture
+
+from api.models import User
+from api.services.loaders import Loader, Loaders
+
+
+class FakePool:
+    def __init__(self):
+        self.queries = []
+        self.error = None
+
+    async def fetch(self, query: str, ids: list):
+        if self.error is not None:
+            raise self.error
+
+        self.queries.append(ids)
+        return [
+            {
+                "id": id,
+                "username": "user%s" % id,
+                "discriminator": "0001",
+                "avatar": None,
+                "app": False,
+            }
+            for id in ids
+            if id > 0
+        ]
+
+
+@pytest.fixture
+def pool(mocker: MockerFixture):
+    pool = FakePool()
+    mocker.patch.object(User, "pool", pool)
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_loader_batches_loads_in_the_same_tick(pool):
+    loader = Loader(User)
+
+    users = await asyncio.gather(loader.load(1), loader.load(2), loader.load(-1))
+
+    assert [user and user.id for user in users] == [1, 2, None]
+    assert pool.queries == [[1, 2, -1]]
+    assert loader.queries == 1
+
+
+@pytest.mark.asyncio
+async def test_loader_memoizes(pool):
+    loader = Loader(User)
+
+    first = await loader.load(1)
+    users = await loader.load_many([1, 2])
+
+    assert users[0] is first
+    assert pool.queries == [[1], [2]]
+
+
+@pytest.mark.asyncio
+async def test_loader_forgets_failures(pool):
+    loader = Loader(User)
+    pool.error = ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        await loader.load(1)
+
+    pool.error = None
+    assert (await loader.load(1)).id == 1
+
+
+@pytest.mark.asyncio
+async def test_loaders_count_queries(pool):
+    loaders = Loaders()
+    loaders.users.prime(User(id=3, username="primed", discriminator="0001"))
+
+    await loaders.users.load_many([1, 2, 3])
+
+    assert loaders.queries == 1
+    assert pool.queries == [[1, 2]]
@@ -0,0 +1,159 @@
+import pytest
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+from postDB import Model
+from pytest_mock import MockerFixture
+
+import config
+from api.middleware import MetricsMiddleware
+from api.services import metrics
+from api.services.queries import InstrumentedPool
+from api.services.redis import InstrumentedRedis
+
+
+@pytest.fixture(autouse=True)
+def registry(mocker: MockerFixture):
+    mocker.patch.object(metrics, "_registry", [])
+
+
+def test_counter():
+    counter = metrics.Counter("requests_total", "Requests.", ["status"])
+    counter.inc("200")
+    counter.inc("200")
+    counter.inc('5"0', amount=3)
+
+    assert counter.render() == "\n".join(
+        [
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{status="200"} 2',
+            'requests_total{status="5\\"0"} 3',
+        ]
+    )
+
+    with pytest.raises(ValueError):
+        counter.inc()
+
+
+def test_histogram():
+    histogram = metrics.Histogram("latency_seconds", "Latency.", buckets=[0.1, 1])
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(2.0)
+
+    assert metrics.render() == "\n".join(
+        [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 2.65",
+            "latency_seconds_count 4",
+            "",
+        ]
+    )
+
+
+def test_gauge_collect():
+    gauge = metrics.Gauge(
+        "connections", "Connections.", ["state"], collect=lambda: [(("idle",), 3)]
+    )
+
+    assert 'connections{state="idle"} 3' in gauge.render()
+
+
+class FakePool:
+    def get_min_size(self):
+        return 1
+
+    def get_max_size(self):
+        return 10
+
+    def get_size(self):
+        return 4
+
+    def get_idle_size(self):
+        return 1
+
+
+def test_collect_pool(mocker: MockerFixture):
+    mocker.patch.object(Model, "pool", InstrumentedPool(FakePool()))
+
+    assert dict(metrics._collect_pool()) == {
+        ("min",): 1,
+        ("max",): 10,
+        ("size",): 4,
+        ("idle",): 1,
+        ("in_use",): 3,
+    }
+
+
+@pytest.mark.asyncio
+async def test_redis_pipeline(mocker: MockerFixture):
+    from fakeredis.aioredis import FakeRedis
+
+    mocker.patch.object(
+        metrics, "REDIS_COMMAND_DURATION", metrics.Histogram("d", "", ["c"])
+    )
+    mocker.patch.object(
+        metrics, "REDIS_PIPELINED_COMMANDS", metrics.Counter("p", "", ["c"])
+    )
+
+    redis = InstrumentedRedis(connection_pool=FakeRedis().connection_pool)
+    async with redis.pipeline() as pipe:
+        pipe.incr("a")
+        pipe.incr("a")
+        pipe.get("a")
+        assert await pipe.execute() == [1, 2, b"2"]
+
+    assert metrics.REDIS_COMMAND_DURATION.labels("PIPELINE").count == 1
+    assert metrics.REDIS_PIPELINED_COMMANDS.labels("INCRBY").value == 2
+    assert metrics.REDIS_PIPELINED_COMMANDS.labels("GET").value == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_allowlist(app: AsyncClient, mocker: MockerFixture):
+    assert (await app.get("/api/metrics")).status_code == 200
+
+    mocker.patch.object(config, "metrics_allow_ips", lambda: "10.0.0.1, 10.0.0.2")
+    assert (await app.get("/api/metrics")).status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_metrics_piston_result_cache(app: AsyncClient, mocker: MockerFixture):
+    mocker.patch.object(metrics, "_registry", [metrics.PISTON_RESULT_CACHE])
+    response = await app.get("/api/metrics")
+
+    for stat in ("hits", "misses", "entries", "bytes"):
+        assert 'piston_result_cache{stat="%s"}' % stat in response.text
+
+
+@pytest.mark.asyncio
+async def test_middleware(mocker: MockerFixture):
+    mocker.patch.object(
+        metrics, "HTTP_REQUESTS", metrics.Counter("r", "", ["m", "r", "s"])
+    )
+    mocker.patch.object(
+        metrics, "HTTP_REQUEST_DURATION", metrics.Histogram("d", "", ["m", "r"])
+    )
+
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{id}")
+    async def fetch_item(id: int):
+        return {}
+
+    async with AsyncClient(app=app, base_url="http://127.0.0.1:8000") as client:
+        await client.get("/items/1")
+        await client.get("/items/2")
+        await client.get("/items/nope")
+        await client.get("/nope")
+
+    assert metrics.HTTP_REQUESTS.labels("GET", "/items/{id}", "200").value == 2
+    assert metrics.HTTP_REQUESTS.labels("GET", "/items/{id}", "422").value == 1
+    assert metrics.HTTP_REQUESTS.labels("GET", "unmatched", "404").value == 1
+    assert metrics.HTTP_REQUEST_DURATION.labels("GET", "/items/{id}").count == 3
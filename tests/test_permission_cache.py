@@ -0,0 +1,33 @@
+import pytest
+
+from pytest_mock import MockerFixture
+
+from api.services import permissions, redis
+from api.services.permissions import UserPermissions
+
+
+@pytest.fixture(autouse=True)
+def pool(mocker: MockerFixture):
+    from fakeredis.aioredis import FakeRedis
+
+    mocker.patch.object(redis, "pool", FakeRedis())
+    permissions._local.clear()
+
+
+@pytest.mark.asyncio
+async def test_store():
+    snapshot = await permissions.snapshot()
+    await permissions.store(1, UserPermissions(8, 2), snapshot)
+
+    assert await permissions.get(1, await permissions.snapshot()) == (8, 2)
+
+
+@pytest.mark.asyncio
+async def test_store_after_invalidate():
+    snapshot = await permissions.snapshot()
+    # Invalidated while the permissions were computed, they might be outdated.
+    await permissions.invalidate(1)
+    await permissions.store(1, UserPermissions(8, 2), snapshot)
+
+    assert await permissions.get(1, snapshot) is None
+    assert await permissions.get(1, await permissions.snapshot()) is None
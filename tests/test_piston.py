@@ -0,0 +1,185 @@
+import asyncio
+import pytest
+
+from pytest_mock import MockerFixture
+
+from api.services import piston
+
+
+RUNTIMES = [
+    piston.Runtime({"language": "python", "version": "3.9.4", "aliases": ["py"]}),
+    piston.Runtime({"language": "python", "version": "3.10.0", "aliases": ["py"]}),
+]
+
+
+@pytest.fixture
+def get_runtimes(mocker: MockerFixture):
+    mocker.patch.object(piston, "_runtime_index", None)
+    mocker.patch.object(piston, "_refresh_task", None)
+    mocker.patch.object(piston, "_refresh_failed_at", float("-inf"))
+    return mocker.patch.object(piston, "get_runtimes", return_value=RUNTIMES)
+
+
+@pytest.mark.asyncio
+async def test_runtime_index_lookups(get_runtimes):
+    assert await piston.has_runtime("py", "3.10.0")
+    assert not await piston.has_runtime("python", "2.7")
+    assert len(await piston.get_runtime("python")) == 2
+    assert await piston.get_runtime("doesntexist") == []
+
+    get_runtimes.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_share_a_request(get_runtimes):
+    await asyncio.gather(*(piston.refresh_runtimes() for _ in range(10)))
+
+    get_runtimes.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_stale_index_is_served_while_refreshing(
+    get_runtimes, mocker: MockerFixture
+):
+    index = await piston.get_runtime_index()
+    mocker.patch.object(piston, "RUNTIMES_TTL", -1)
+
+    assert await piston.get_runtime_index() is index
+    await piston.refresh_runtimes()
+
+    assert await piston.get_runtime_index() is not index
+    assert get_runtimes.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_refreshes_are_spaced_out(get_runtimes, mocker: MockerFixture):
+    index = await piston.get_runtime_index()
+    mocker.patch.object(piston, "RUNTIMES_TTL", -1)
+    get_runtimes.side_effect = OSError("Piston is down")
+
+    for _ in range(5):
+        assert await piston.get_runtime_index() is index
+        await asyncio.sleep(0.01)  # Let a started refresh fail.
+
+    # The first fetch and a single failed refresh, the stale index is served meanwhile.
+    assert get_runtimes.call_count == 2
+
+    mocker.patch.object(piston, "RUNTIMES_RETRY_INTERVAL", -1)
+    await piston.get_runtime_index()
+    await asyncio.sleep(0.01)
+    assert get_runtimes.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_runs_concurrently(mocker: MockerFixture):
+    async def make_request(method: str, endpoint: str, data: dict):
+        await asyncio.sleep(float(data["stdin"]))
+        return {"run": {"stdout": data["stdin"], "code": 0}}
+
+    mocker.patch.object(piston, "_make_request", make_request)
+
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    results = [
+        (index, result)
+        async for index, result in piston.execute_batch(
+            "python", "3.10.0", "print(input())", ["0.2", "0.1", "0.2", "0.2"]
+        )
+    ]
+
+    assert loop.time() - started < 0.4
+    assert results[0][0] == 1
+    assert sorted(index for index, _ in results) == [0, 1, 2, 3]
+    assert all(result.success for _, result in results)
+
+
+@pytest.mark.asyncio
+async def test_execute_batch_timeout(mocker: MockerFixture):
+    async def make_request(method: str, endpoint: str, data: dict):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(piston, "_make_request", make_request)
+
+    results = [
+        result
+        async for _, result in piston.execute_batch(
+            "python", "3.10.0", "", [""], timeout=0.01
+        )
+    ]
+
+    assert not results[0].success
+    assert results[0].error == "Execution timed out"
+
+
+@pytest.fixture
+def result_cache(mocker: MockerFixture):
+    from fakeredis.aioredis import FakeRedis
+    from api.services import redis
+
+    mocker.patch.object(redis, "pool", FakeRedis())
+    return redis.pool
+
+
+@pytest.mark.asyncio
+async def test_execute_result_cache(result_cache, mocker: MockerFixture):
+    make_request = mocker.patch.object(
+        piston, "_make_request", return_value={"run": {"stdout": "1", "code": 0}}
+    )
+
+    for _ in range(3):
+        result = await piston.execute("python", "3.10.0", "print(1)")
+        assert result.stdout == "1"
+
+    await piston.execute("python", "3.10.0", "print(1)", stdin="changed")
+
+    assert make_request.call_count == 2
+    stats = await piston.result_cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["entries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_execute_result_cache_eviction(result_cache, mocker: MockerFixture):
+    mocker.patch.object(
+        piston, "_make_request", return_value={"run": {"stdout": "x" * 100}}
+    )
+    mocker.patch.object(piston, "RESULT_CACHE_MAX_BYTES", 300)
+
+    for i in range(5):
+        await piston.execute("python", "3.10.0", "print(%s)" % i)
+
+    stats = await piston.result_cache_stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= 300
+
+
+@pytest.mark.asyncio
+async def test_execute_result_cache_skips_killed(result_cache, mocker: MockerFixture):
+    make_request = mocker.patch.object(
+        piston,
+        "_make_request",
+        return_value={"run": {"stdout": "", "code": None, "signal": "SIGKILL"}},
+    )
+
+    for _ in range(2):
+        await piston.execute("python", "3.10.0", "while True: pass")
+
+    assert make_request.call_count == 2
+    assert (await piston.result_cache_stats())["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_execute_without_redis(mocker: MockerFixture):
+    from fakeredis import FakeServer
+    from fakeredis.aioredis import FakeRedis
+    from api.services import redis
+
+    server = FakeServer()
+    server.connected = False
+    mocker.patch.object(redis, "pool", FakeRedis(server=server))
+    mocker.patch.object(
+        piston, "_make_request", return_value={"run": {"stdout": "1", "code": 0}}
+    )
+
+    assert (await piston.execute("python", "3.10.0", "print(1)")).stdout == "1"
@@ -0,0 +1,81 @@
+import pytest
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+
+import config
+from api.middleware import QueryMiddleware
+from api.services import queries
+
+
+class FakeConnection:
+    async def fetchval(self, query: str, *args):
+        return 1
+
+
+class FakeAcquireContext:
+    async def __aenter__(self):
+        return FakeConnection()
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakePool:
+    size = 10
+
+    async def fetch(self, query: str, *args):
+        return []
+
+    def acquire(self):
+        return FakeAcquireContext()
+
+
+def test_fingerprint():
+    assert queries.fingerprint(
+        """
+        SELECT *
+          FROM roles
+         WHERE name = 'it''s' AND position > 10 AND id IN ($1, $2)
+        """
+    ) == "SELECT * FROM roles WHERE name = ? AND position > ? AND id IN (...)"
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool():
+    pool = queries.InstrumentedPool(FakePool())
+    stats = queries.start()
+
+    for id in range(queries.REPEAT_THRESHOLD):
+        await pool.fetch("SELECT * FROM users WHERE id = %s" % id)
+
+    async with pool.acquire() as con:
+        assert await con.fetchval("SELECT 1") == 1
+
+    assert pool.size == 10
+    assert stats.count == queries.REPEAT_THRESHOLD + 1
+    assert stats.duration > 0
+    assert stats.repeated(queries.REPEAT_THRESHOLD) == {
+        "SELECT * FROM users WHERE id = ?": queries.REPEAT_THRESHOLD
+    }
+
+
+@pytest.mark.asyncio
+async def test_middleware(mocker: MockerFixture):
+    mocker.patch.object(config, "debug", lambda: True)
+    pool = queries.InstrumentedPool(FakePool())
+
+    app = FastAPI()
+    app.add_middleware(QueryMiddleware)
+
+    @app.get("/")
+    async def index():
+        await pool.fetch("SELECT 1")
+        await pool.fetch("SELECT 2")
+        return {}
+
+    async with AsyncClient(app=app, base_url="http://127.0.0.1:8000") as client:
+        res = await client.get("/")
+
+    assert res.headers["Server-Timing"].startswith('db;desc="2 queries";dur=')
@@ -0,0 +1,76 @@
+import pytest
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+
+from api.middleware import RateLimitMiddleware
+from api.services import ratelimit, redis
+
+
+TIER = ratelimit.Tier("test", capacity=3, rate=1.0)
+
+
+@pytest.fixture(autouse=True)
+def buckets(mocker: MockerFixture):
+    from fakeredis.aioredis import FakeRedis
+
+    mocker.patch.object(redis, "pool", FakeRedis())
+    mocker.patch.object(ratelimit, "enabled", True)
+    ratelimit.reset()
+    yield
+    ratelimit.reset()
+
+
+@pytest.mark.asyncio
+async def test_hit_limits(mocker: MockerFixture):
+    now = 1000.0
+    mocker.patch("time.time", lambda: now)
+
+    results = [await ratelimit.hit("key", TIER) for _ in range(4)]
+
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results] == [2, 1, 0, 0]
+    assert results[-1].retry_after == pytest.approx(1.0)
+
+    now += 1.5
+    assert (await ratelimit.hit("key", TIER)).allowed
+    assert (await ratelimit.hit("other key", TIER)).remaining == 2
+
+
+@pytest.mark.asyncio
+async def test_hit_cost(mocker: MockerFixture):
+    mocker.patch("time.time", lambda: 1000.0)
+
+    assert not (await ratelimit.hit("key", TIER, 4)).allowed
+    assert (await ratelimit.hit("key", TIER, 3)).allowed
+
+
+@pytest.mark.asyncio
+async def test_middleware(mocker: MockerFixture):
+    mocker.patch.dict(ratelimit.TIERS, {"anonymous": TIER})
+
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware)
+
+    @app.get("/cheap")
+    async def cheap():
+        return {}
+
+    @app.get("/expensive")
+    @ratelimit.cost(2)
+    async def expensive():
+        return {}
+
+    async with AsyncClient(app=app, base_url="http://127.0.0.1:8000") as client:
+        res = await client.get("/expensive")
+        assert res.status_code == 200
+        assert res.headers["X-RateLimit-Remaining"] == "1"
+
+        res = await client.get("/expensive")
+        assert res.status_code == 429
+        assert res.headers["Retry-After"] == "1"
+
+        res = await client.get("/cheap")
+        assert res.status_code == 200
+        assert res.headers["X-RateLimit-Remaining"] == "0"
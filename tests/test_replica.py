@@ -0,0 +1,94 @@
+import pytest
+import asyncio
+
+from fastapi import FastAPI
+from httpx import AsyncClient
+from postDB import Model
+from pytest_mock import MockerFixture
+
+import config
+from api.middleware import ReadYourWritesMiddleware
+from api.services import redis, replica, users
+
+
+class FakePool:
+    def __init__(self, lag=0.0):
+        self.lag = lag
+        self.checks = 0
+
+    async def fetchval(self, query: str, *args):
+        self.checks += 1
+        if isinstance(self.lag, Exception):
+            raise self.lag
+
+        return self.lag
+
+
+@pytest.fixture(autouse=True)
+def pools(mocker: MockerFixture):
+    from fakeredis.aioredis import FakeRedis
+
+    mocker.patch.object(redis, "pool", FakeRedis())
+    mocker.patch.object(Model, "pool", FakePool())
+    mocker.patch.object(replica, "pool", FakePool())
+    mocker.patch.object(replica, "_check", None)
+
+
+@pytest.mark.asyncio
+async def test_choose():
+    assert await replica.choose(1) is replica.pool
+
+    await replica.stick(1)
+    assert await replica.choose(1) is Model.pool
+    assert await replica.choose(2) is replica.pool
+
+
+@pytest.mark.asyncio
+async def test_choose_lagging(mocker: MockerFixture):
+    mocker.patch.object(config, "replica_max_lag", lambda: 1.0)
+    replica.pool.lag = 5.0
+
+    assert await replica.choose() is Model.pool
+    assert await replica.choose() is Model.pool
+    # Measured once for both reads.
+    assert replica.pool.checks == 1
+
+
+@pytest.mark.asyncio
+async def test_choose_unreachable():
+    replica.pool.lag = OSError("Connection refused")
+
+    assert await replica.lag() == float("inf")
+    assert await replica.choose() is Model.pool
+
+
+@pytest.mark.asyncio
+async def test_lag_shared():
+    lags = await asyncio.gather(*(replica.lag() for _ in range(10)))
+
+    assert lags == [0.0] * 10
+    assert replica.pool.checks == 1
+
+
+@pytest.mark.asyncio
+async def test_middleware(mocker: MockerFixture):
+    mocker.patch.object(users, "decode", lambda token: {"uid": int(token)})
+
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    @app.post("/ok")
+    async def ok():
+        return {}
+
+    @app.post("/fail", status_code=400)
+    async def fail():
+        return {}
+
+    async with AsyncClient(app=app, base_url="http://127.0.0.1:8000") as client:
+        await client.post("/ok", headers={"authorization": "1"})
+        await client.post("/fail", headers={"authorization": "2"})
+        await client.post("/ok")
+
+    assert await replica.is_sticky(1)
+    assert not await replica.is_sticky(2)
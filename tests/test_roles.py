@@ -391,3 +391,168 @@ async def test_update_role_positions_down(
         )
         for role in roles:
             await db.execute("DELETE FROM roles WHERE id = $1", role.id)
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_bulk_update_role_positions(
+    app: AsyncClient, db, user, token, manage_roles_role
+):
+    try:
+        roles = []
+        # manage roles -> 1 -> 4 -> 2 -> 3
+        role_names = ["1", "4", "2", "3"]
+        for role_name in role_names:
+            query = """
+                INSERT INTO roles (id, name, color, permissions, position)
+                    VALUES (create_snowflake(), $1, 0, 0, (SELECT COUNT(*) FROM roles) + 1)
+                    RETURNING *;
+            """
+            role = Role(**await Role.pool.fetchrow(query, role_name))
+            roles.append(role)
+
+        await UserRole.create(user.id, manage_roles_role.id)
+
+        res = await app.patch(
+            "/api/v1/roles",
+            json=[{"id": roles[1].id, "position": 1}],
+            headers={"Authorization": token},
+        )
+        assert res.status_code == 403
+
+        res = await app.patch(
+            "/api/v1/roles",
+            json=[{"id": roles[1].id, "position": 5}],
+            headers={"Authorization": token},
+        )
+        assert res.status_code == 204
+
+        res = await app.get("/api/v1/roles")
+        new_roles = sorted(res.json(), key=lambda x: x["position"])
+
+        for i, role in enumerate(new_roles, 1):
+            assert role["position"] == i
+
+        assert new_roles[0]["id"] == str(manage_roles_role.id)
+        for i in range(1, 5):
+            assert new_roles[i]["name"] == str(i)
+    finally:
+        await db.execute(
+            "DELETE FROM userroles WHERE role_id = $1 AND user_id = $2;",
+            manage_roles_role.id,
+            user.id,
+        )
+        for role in roles:
+            await db.execute("DELETE FROM roles WHERE id = $1", role.id)
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_fetch_all_roles_etag(
+    app: AsyncClient, db, user, token, manage_roles_role
+):
+    res = await app.get("/api/v1/roles")
+    etag = res.headers["ETag"]
+
+    res = await app.get("/api/v1/roles", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+
+    try:
+        await UserRole.create(user.id, manage_roles_role.id)
+        res = await app.post(
+            "/api/v1/roles",
+            json={"name": "test etag"},
+            headers={"Authorization": token},
+        )
+        assert res.status_code == 201
+
+        res = await app.get("/api/v1/roles", headers={"If-None-Match": etag})
+        assert res.status_code == 200
+        assert res.headers["ETag"] != etag
+        assert "test etag" in [role["name"] for role in res.json()]
+    finally:
+        await db.execute(
+            "DELETE FROM userroles WHERE role_id = $1 AND user_id = $2;",
+            manage_roles_role.id,
+            user.id,
+        )
+        await db.execute("DELETE FROM roles WHERE name = 'test etag'")
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_fetch_role_members(app: AsyncClient, db, user):
+    try:
+        query = """
+            INSERT INTO roles (id, name, color, permissions, position)
+                VALUES (create_snowflake(), 'test members', 0, 0, (SELECT COUNT(*) FROM roles) + 1)
+                RETURNING *;
+        """
+        role = Role(**await Role.pool.fetchrow(query))
+        await UserRole.create(user.id, role.id)
+
+        res = await app.get(f"/api/v1/roles/{role.id}")
+        assert res.status_code == 200
+        assert res.json()["member_count"] == 1
+        assert "members" not in res.json()
+
+        res = await app.get(f"/api/v1/roles/{role.id}?members=true")
+        assert res.json()["members"] == [str(user.id)]
+
+        res = await app.get(f"/api/v1/roles/{role.id}/members?limit=1")
+        assert res.json() == [str(user.id)]
+
+        res = await app.get(f"/api/v1/roles/{role.id}/members?after={user.id}")
+        assert res.json() == []
+
+        res = await app.get("/api/v1/roles/0/members")
+        assert res.status_code == 404
+    finally:
+        await db.execute("DELETE FROM roles WHERE id = $1", role.id)
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_bulk_role_members(app: AsyncClient, db, user, token, manage_roles_role):
+    try:
+        query = """
+            INSERT INTO roles (id, name, color, permissions, position)
+                VALUES (create_snowflake(), 'test bulk', 0, 0, (SELECT COUNT(*) FROM roles) + 1)
+                RETURNING *;
+        """
+        role = Role(**await Role.pool.fetchrow(query))
+        await UserRole.create(user.id, manage_roles_role.id)
+
+        res = await app.put(
+            f"/api/v1/roles/{role.id}/members",
+            json={"ids": [user.id, 1]},
+            headers={"Authorization": token},
+        )
+        assert res.status_code == 200
+        assert sorted(res.json(), key=lambda x: x["id"]) == [
+            {"id": str(user.id), "status": "added"},
+            {"id": "1", "status": "unknown_user"},
+        ]
+
+        res = await app.put(
+            f"/api/v1/roles/{role.id}/members",
+            json={"ids": [user.id]},
+            headers={"Authorization": token},
+        )
+        assert res.json() == [{"id": str(user.id), "status": "already_present"}]
+
+        res = await app.request(
+            "DELETE",
+            f"/api/v1/roles/{role.id}/members",
+            json={"ids": [user.id]},
+            headers={"Authorization": token},
+        )
+        assert res.status_code == 200
+        assert res.json() == [{"id": str(user.id), "status": "removed"}]
+    finally:
+        await db.execute(
+            "DELETE FROM userroles WHERE role_id = $1 AND user_id = $2;",
+            manage_roles_role.id,
+            user.id,
+        )
+        await db.execute("DELETE FROM roles WHERE id = $1", role.id)
@@ -0,0 +1,202 @@
+import asyncio
+import pytest
+
+from aioredis import Redis
+from fakeredis.aioredis import FakeRedis
+from postDB import Model
+from pytest_mock import MockerFixture
+
+import config
+from api.services import piston, redis, submissions
+
+
+@pytest.fixture
+async def queue(mocker: MockerFixture):
+    """A real redis server, fakeredis doesn't implement streams."""
+    if (redis_uri := config.test_redis_uri()) is None:
+        pytest.skip("needs TEST_REDIS_URI")
+
+    pool = Redis.from_url(redis_uri)
+    await pool.delete(submissions.STREAM_KEY)
+
+    mocker.patch.object(redis, "pool", pool)
+    mocker.patch.object(submissions, "BLOCK_MS", 10)
+    yield pool
+
+    await pool.delete(submissions.STREAM_KEY)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_grades_queued_submissions(queue, mocker: MockerFixture):
+    graded = []
+
+    async def grade(submission_id: int):
+        graded.append(submission_id)
+        if len(graded) == 3:
+            worker.stop()
+
+    mocker.patch.object(submissions, "grade", grade)
+    worker = submissions.Worker(concurrency=2, name="test")
+
+    for submission_id in range(3):
+        await submissions.enqueue(submission_id)
+
+    await asyncio.wait_for(worker.run(), timeout=5)
+
+    assert sorted(graded) == [0, 1, 2]
+    pending = await queue.xpending(submissions.STREAM_KEY, submissions.GROUP_NAME)
+    assert pending["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_worker_limits_concurrency(queue, mocker: MockerFixture):
+    running = 0
+    most_running = 0
+
+    async def grade(submission_id: int):
+        nonlocal running, most_running
+        running += 1
+        most_running = max(running, most_running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    mocker.patch.object(submissions, "grade", grade)
+    worker = submissions.Worker(concurrency=2, name="test")
+
+    for submission_id in range(6):
+        await submissions.enqueue(submission_id)
+
+    task = asyncio.ensure_future(worker.run())
+    await asyncio.sleep(0.3)
+    worker.stop()
+    await asyncio.wait_for(task, timeout=5)
+
+    assert most_running == 2
+
+
+@pytest.mark.asyncio
+async def test_worker_claims_stale_submissions(queue, mocker: MockerFixture):
+    graded = []
+
+    async def grade(submission_id: int):
+        graded.append(submission_id)
+        worker.stop()
+
+    mocker.patch.object(submissions, "grade", grade)
+    mocker.patch.object(submissions, "CLAIM_IDLE_MS", 0)
+    mocker.patch.object(submissions, "CLAIM_INTERVAL", 0)
+
+    async def read(last_id: str, block: int):
+        await asyncio.sleep(0.01)
+        return []
+
+    # Only get submissions by claiming them.
+    worker = submissions.Worker(concurrency=2, name="test")
+    mocker.patch.object(worker, "_read", read)
+    task = asyncio.ensure_future(worker.run())
+    await asyncio.sleep(0.05)
+
+    # Read by a worker which died before grading it, while this worker is running.
+    await submissions.enqueue(1)
+    await queue.xreadgroup(
+        submissions.GROUP_NAME, "dead", {submissions.STREAM_KEY: ">"}
+    )
+
+    await asyncio.wait_for(task, timeout=5)
+
+    assert graded == [1]
+
+
+class FakePool:
+    def __init__(self, test_cases):
+        self.test_cases = test_cases
+        self.executed = []
+
+    async def fetchrow(self, query: str, *args):
+        return {
+            "challenge_id": 1,
+            "code": "print(input())",
+            "piston_lang": "python",
+            "piston_lang_ver": "3.9.4",
+        }
+
+    async def fetch(self, query: str, *args):
+        return self.test_cases
+
+    async def execute(self, query: str, *args):
+        self.executed.append(args)
+
+
+@pytest.mark.asyncio
+async def test_grade(mocker: MockerFixture):
+    pool = FakePool(
+        [
+            {"id": 1, "stdin": "a", "expected_output": "a"},
+            {"id": 2, "stdin": "b", "expected_output": "c"},
+            {"id": 3, "stdin": "d", "expected_output": "d"},
+        ]
+    )
+    mocker.patch.object(Model, "pool", pool)
+
+    async def execute_batch(language, version, source, stdins):
+        # Out of order, like executions completing.
+        yield 2, piston.ExecutionResult.from_error("Execution timed out")
+        for index, stdin in list(enumerate(stdins))[:2]:
+            yield index, piston.ExecutionResult({"run": {"stdout": stdin, "code": 0}})
+
+    mocker.patch.object(piston, "execute_batch", execute_batch)
+    await submissions.grade(5)
+
+    [(submission_id, status, passed, total, results)] = pool.executed
+    assert (submission_id, status, passed, total) == (5, "failed", 1, 3)
+    assert results == [
+        {"test_case_id": "1", "passed": True, "error": None},
+        {"test_case_id": "2", "passed": False, "error": None},
+        {"test_case_id": "3", "passed": False, "error": "Execution timed out"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_grade_passed(mocker: MockerFixture):
+    pool = FakePool([{"id": 1, "stdin": "a", "expected_output": "a\n"}])
+    mocker.patch.object(Model, "pool", pool)
+
+    async def execute_batch(language, version, source, stdins):
+        yield 0, piston.ExecutionResult({"run": {"stdout": "a\n", "code": 0}})
+
+    mocker.patch.object(piston, "execute_batch", execute_batch)
+    await submissions.grade(5)
+
+    assert pool.executed[0][1:4] == ("passed", 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_grade_without_test_cases(mocker: MockerFixture):
+    pool = FakePool([])
+    mocker.patch.object(Model, "pool", pool)
+
+    await submissions.grade(5)
+
+    assert pool.executed[0][1:4] == ("failed", 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_grade_without_redis(mocker: MockerFixture):
+    graded = []
+
+    async def grade(submission_id: int):
+        graded.append(submission_id)
+
+    mocker.patch.object(redis, "pool", FakeRedis())
+    mocker.patch.object(submissions, "grade", grade)
+    mocker.patch.object(submissions, "_worker_task", None)
+
+    # No worker, fakeredis has no streams to read submissions from.
+    submissions.start_worker(concurrency=1)
+    assert submissions._worker_task is None
+
+    await submissions.enqueue(1)
+    await submissions.stop_worker()
+
+    assert graded == [1]
@@ -0,0 +1,44 @@
+import pytest
+
+from types import SimpleNamespace
+from pytest_mock import MockerFixture
+
+from api.services import redis, users
+from utils.cache import LRUCache
+
+
+@pytest.fixture(autouse=True)
+def pool(mocker: MockerFixture):
+    from fakeredis.aioredis import FakeRedis
+
+    mocker.patch.object(redis, "pool", FakeRedis())
+    mocker.patch.object(users, "_local", LRUCache())
+    mocker.patch.object(users, "_version", None)
+    mocker.patch.object(users, "_version_checked_at", 0.0)
+
+
+@pytest.mark.asyncio
+async def test_invalidate():
+    users._local.set("a", SimpleNamespace(id=1))
+    users._local.set("b", SimpleNamespace(id=2))
+
+    await users.invalidate(1)
+
+    assert "a" not in users._local
+    assert "b" in users._local
+
+
+@pytest.mark.asyncio
+async def test_invalidated_by_other_process(mocker: MockerFixture):
+    await users._check_version()
+    users._local.set("a", SimpleNamespace(id=1))
+
+    # Another process invalidates a user, this one doesn't know which tokens are theirs.
+    await redis.pool.incr(users.VERSION_KEY)
+
+    await users._check_version()
+    assert "a" in users._local  # Checked less than `VERSION_INTERVAL` seconds ago.
+
+    mocker.patch.object(users, "VERSION_INTERVAL", 0)
+    await users._check_version()
+    assert "a" not in users._local
@@ -0,0 +1,66 @@
+import pytest
+
+from httpx import AsyncClient
+
+from api.models import Role, UserRole
+
+
+@pytest.fixture
+async def role(db):
+    query = """
+        INSERT INTO roles (id, name, color, permissions, position)
+            VALUES (create_snowflake(), $1, $2, $3, (SELECT COUNT(*) FROM roles) + 1)
+            RETURNING *;
+    """
+    record = await Role.pool.fetchrow(query, "Users Test", 0x0, 0)
+    yield Role(**record)
+    await db.execute("DELETE FROM roles WHERE id = $1;", record["id"])
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_fetch_current_user(app: AsyncClient, db, user, token, role):
+    await UserRole.create(user.id, role.id)
+
+    res = await app.get("/api/v1/users/@me", headers={"Authorization": token})
+
+    assert res.status_code == 200
+    assert res.json()["id"] == str(user.id)
+    assert res.json()["roles"] == [str(role.id)]
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_fetch_users(app: AsyncClient, db, user, token, role):
+    await UserRole.create(user.id, role.id)
+
+    res = await app.get(
+        "/api/v1/users",
+        params=[("ids", 1), ("ids", user.id)],
+        headers={"Authorization": token},
+    )
+
+    assert res.status_code == 200
+    assert [(u["id"], u["roles"]) for u in res.json()] == [
+        (str(user.id), [str(role.id)])
+    ]
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_fetch_users_limit(app: AsyncClient, db, token):
+    res = await app.get(
+        "/api/v1/users",
+        params=[("ids", id) for id in range(101)],
+        headers={"Authorization": token},
+    )
+
+    assert res.status_code == 400
+
+
+@pytest.mark.db
+@pytest.mark.asyncio
+async def test_fetch_users_unauthorized(app: AsyncClient, db):
+    res = await app.get("/api/v1/users", params=[("ids", 1)])
+
+    assert res.status_code == 401
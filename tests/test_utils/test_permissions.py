@@ -0,0 +1,19 @@
+import pytest
+
+import utils
+from api.models.permissions import Administrator, ManageRoles
+
+
+@pytest.mark.parametrize(
+    ("permissions", "expected"),
+    [
+        (0, False),
+        (ManageRoles().value, True),
+        (Administrator().value, True),
+    ],
+)
+def test_has_permissions_compiled(permissions, expected):
+    required = utils.compile_permissions([ManageRoles()])
+
+    assert utils.has_permissions(permissions, required) is expected
+    assert utils.has_permissions(permissions, [ManageRoles()]) is expected
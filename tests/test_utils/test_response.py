@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import List, Optional
+import pytest
+
+from pydantic import BaseModel, ValidationError
+
+from utils import (
+    JSONResponse,
+    RawJSONResponse,
+    TrustedJSONResponse,
+)
+
+
+SNOWFLAKE = 6802059911472611845
+
+
+def test_render():
+    response = JSONResponse(
+        {"id": SNOWFLAKE, "created_at": datetime(2021, 6, 10, 17, 41, 58, 257000)}
+    )
+
+    assert response.body == (
+        b'{"id":%d,"created_at":"2021-06-10T17:41:58"}' % SNOWFLAKE
+    )
+
+
+def test_render_ints_as_str():
+    content = [{"id": SNOWFLAKE, "position": 1, "app": True, "ids": [SNOWFLAKE]}]
+    expected = b'[{"id":"%d","position":1,"app":true,"ids":["%d"]}]' % (
+        SNOWFLAKE,
+        SNOWFLAKE,
+    )
+
+    assert JSONResponse(content, ints_as_str=True).body == expected
+    assert JSONResponse(content).body != expected
+
+
+def test_trusted_response_validation(monkeypatch: pytest.MonkeyPatch):
+    class Model(BaseModel):
+        id: str
+        name: Optional[str]
+
+    monkeypatch.setattr(TrustedJSONResponse, "validate", False)
+    TrustedJSONResponse([{"id": 1, "name": None}], List[Model])
+
+    monkeypatch.setattr(TrustedJSONResponse, "validate", True)
+    TrustedJSONResponse([{"id": "1", "name": None}], List[Model])
+
+    with pytest.raises(ValueError):  # Not rendered as a string.
+        TrustedJSONResponse([{"id": 1, "name": None}], List[Model])
+
+    with pytest.raises(ValueError):  # Not part of the model.
+        TrustedJSONResponse([{"id": "1", "name": None, "secret": ""}], List[Model])
+
+    with pytest.raises(ValidationError):
+        TrustedJSONResponse([{"name": "missing id"}], List[Model])
+
+
+def test_raw_response(monkeypatch: pytest.MonkeyPatch):
+    body = b'[{"id": "1", "name": null}]'
+
+    class Model(BaseModel):
+        id: str
+        name: Optional[str]
+
+    monkeypatch.setattr(TrustedJSONResponse, "validate", True)
+    assert RawJSONResponse(body, List[Model]).body == body
+
+    with pytest.raises(ValueError):
+        RawJSONResponse(b'[{"id": 1, "name": null}]', List[Model])
@@ -1,10 +1,23 @@
+from .cache import LRUCache
 from .time import snowflake_time
-from .response import JSONResponse
-from .permissions import has_permission, has_permissions
+from .response import (
+    JSONResponse,
+    RawJSONResponse,
+    TrustedJSONResponse,
+)
+from .permissions import (
+    has_permission,
+    has_permissions,
+    compile_permissions,
+)
 
 __all__ = (
+    LRUCache,
     JSONResponse,
+    RawJSONResponse,
+    TrustedJSONResponse,
     snowflake_time,
     has_permission,
     has_permissions,
+    compile_permissions,
 )
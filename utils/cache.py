@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+import time
+
+
+class LRUCache:
+    """
+    A small in-process LRU cache where every entry has its own time to live.
+
+    :param int maxsize:     Maximum amount of entries kept before evicting the least recently used one.
+    :param float ttl:       Default time to live of an entry, in seconds.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value stored at `key` or `default` if it's missing or expired."""
+        try:
+            value, expires_at = self._data[key]
+        except KeyError:
+            return default
+
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores `value` at `key` for `ttl` seconds, defaults to the cache ttl."""
+        if ttl is None:
+            ttl = self.ttl
+
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes `key` from the cache and returns its value."""
+        value, _ = self._data.pop(key, (default, None))
+        return value
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Returns a snapshot of all the entries that haven't expired yet."""
+        now = time.monotonic()
+        return [
+            (key, value)
+            for key, (value, expires_at) in list(self._data.items())
+            if expires_at > now
+        ]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _missing) is not _missing
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_missing = object()
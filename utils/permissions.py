@@ -1,14 +1,12 @@
-from typing import Union, List
+from typing import Iterable, List, Union
 from api.models.permissions import BasePermission, Administrator
 
 
-def has_permissions(
-    permissions: int, required: List[Union[int, BasePermission]]
-) -> bool:
-    """Returns `True` if `permissions` has all required permissions"""
-    if permissions & Administrator().value:
-        return True
+ADMINISTRATOR: int = Administrator().value
 
+
+def compile_permissions(required: Iterable[Union[int, BasePermission]]) -> int:
+    """Combines the `required` permissions into a single bitmask."""
     all_perms = 0
     for perm in required:
         if isinstance(perm, int):
@@ -16,12 +14,30 @@ def has_permissions(
         else:
             all_perms |= perm.value
 
-    return permissions & all_perms == all_perms
+    return all_perms
+
+
+def has_permissions(
+    permissions: int, required: Union[int, List[Union[int, BasePermission]]]
+) -> bool:
+    """
+    Returns `True` if `permissions` has all required permissions.
+
+    `required` can be a bitmask built with :func:`compile_permissions`,
+    which avoids rebuilding it on every call.
+    """
+    if permissions & ADMINISTRATOR:
+        return True
+
+    if not isinstance(required, int):
+        required = compile_permissions(required)
+
+    return permissions & required == required
 
 
 def has_permission(permissions: int, permission: Union[BasePermission, int]) -> bool:
     """Returns `True` if `permissions` has required permission"""
-    if permissions & Administrator().value:
+    if permissions & ADMINISTRATOR:
         return True
 
     if isinstance(permission, int):
@@ -1,12 +1,104 @@
-from datetime import datetime
 import typing
 
+import orjson
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse as BaseResponse
+from pydantic import parse_obj_as
+
+# Integers outside of this range can't be represented exactly by JavaScript clients.
+MAX_SAFE_INTEGER = 2 ** 53 - 1
+
+OPTIONS = orjson.OPT_OMIT_MICROSECONDS | orjson.OPT_NON_STR_KEYS
+
+
+def _stringify(value: typing.Any) -> typing.Any:
+    kind = type(value)
+
+    if kind is int:
+        return value if -MAX_SAFE_INTEGER <= value <= MAX_SAFE_INTEGER else str(value)
+
+    if kind is dict:
+        return {key: _stringify(item) for key, item in value.items()}
+
+    if kind is list or kind is tuple:
+        return [_stringify(item) for item in value]
+
+    return value
+
+
+def stringify_ints(content: typing.Any) -> typing.Any:
+    """
+    Converts the integers in `content` that JavaScript can't represent to strings.
+
+    This walks the content in Python, casting ids to text in SQL is still faster.
+    """
+    return _stringify(content)
 
 
 class JSONResponse(BaseResponse):
+    """
+    Renders content with orjson, datetimes are rendered without microseconds.
+
+    :param bool ints_as_str:    Render integers too large for JavaScript, like snowflakes,
+                                as strings so they don't have to be cast in SQL.
+                                Defaults to the class attribute.
+    """
+
+    ints_as_str = False
+
+    def __init__(
+        self,
+        content: typing.Any = None,
+        *args,
+        ints_as_str: typing.Optional[bool] = None,
+        **kwargs
+    ):
+        if ints_as_str is not None:
+            self.ints_as_str = ints_as_str
+
+        super().__init__(content, *args, **kwargs)
+
     def render(self, content: typing.Any) -> bytes:
-        if isinstance(content, datetime):
-            return content.replace(microsecond=0).isoformat()
+        if self.ints_as_str:
+            content = stringify_ints(content)
+
+        return orjson.dumps(content, option=OPTIONS)
+
+
+def validate_response(model: typing.Any, content: typing.Any) -> None:
+    """Raises if `content` isn't exactly what FastAPI renders for a `response_model`."""
+    expected = jsonable_encoder(parse_obj_as(model, content))
+
+    if expected != jsonable_encoder(content):
+        raise ValueError("Response content doesn't match %s" % model)
+
+
+class TrustedJSONResponse(JSONResponse):
+    """
+    Renders `content` that's already shaped like `model` without validating it,
+    for routes whose queries guarantee the schema of the response.
+    Keep `model` as the `response_model` of the route so it's still documented.
+
+    Set `validate` (done in tests) to check the content against `model` anyway.
+    """
+
+    validate = False
+
+    def __init__(self, content: typing.Any, model: typing.Any, *args, **kwargs):
+        if self.validate:
+            validate_response(model, self.decode(content))
+
+        super().__init__(content, *args, **kwargs)
+
+    def decode(self, content: typing.Any) -> typing.Any:
+        return content
+
+
+class RawJSONResponse(TrustedJSONResponse):
+    """A :class:`TrustedJSONResponse` whose content is already rendered JSON, sent as is."""
+
+    def decode(self, content: bytes) -> typing.Any:
+        return orjson.loads(content)
 
-        return super().render(content)
+    def render(self, content: bytes) -> bytes:
+        return content